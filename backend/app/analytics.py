@@ -0,0 +1,137 @@
+"""
+Incrementally maintained sales rollups.
+
+Dashboards read small rollup tables (sales by sweet, by category, per hour
+and per day) instead of grouping raw order_items, so a query costs the same
+however long the order history is. refresh_rollups folds new order items
+into them in batches and runs every ROLLUP_REFRESH_INTERVAL seconds.
+
+Progress is tracked per row (order_items.rolled_up, with a partial index on
+the pending ones) rather than with a "last id" watermark: on PostgreSQL ids
+come from a sequence and can commit out of order, so a watermark could step
+over an item whose transaction was still open. Items are claimed with one
+UPDATE, exactly like ledger compaction, so concurrent refreshes never count
+an item twice. Revenue uses the unit price recorded at checkout; an item is
+filed under its sweet's category at the time it is rolled up.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, false, insert, select, update
+from sqlalchemy.orm import Session
+from . import models
+
+UNCATEGORIZED = "uncategorized"
+
+_items = models.OrderItem.__table__
+_orders = models.Order.__table__
+_sweets = models.Sweet.__table__
+_by_sweet = models.SalesBySweet.__table__
+_by_category = models.SalesByCategory.__table__
+_hourly = models.SalesHourly.__table__
+_daily = models.SalesDaily.__table__
+
+
+def _claim(db: Session, limit: int):
+    """Mark up to limit pending items as rolled up; returns (order_id, sweet_id, quantity, unit_price) rows."""
+    pending = select(_items.c.id).where(_items.c.rolled_up == false()).order_by(_items.c.id).limit(limit)
+    columns = (_items.c.order_id, _items.c.sweet_id, _items.c.quantity, _items.c.unit_price)
+    claim = update(_items).where(_items.c.id.in_(pending), _items.c.rolled_up == false()).values(rolled_up=True)
+    if db.get_bind().dialect.update_returning:
+        return db.execute(claim.returning(*columns)).all()
+    ids = db.scalars(pending).all()
+    claimed = db.execute(select(*columns).where(_items.c.id.in_(ids))).all()
+    marked = db.execute(update(_items).where(_items.c.id.in_(ids), _items.c.rolled_up == false()).values(rolled_up=True))
+    if marked.rowcount != len(ids):
+        # Another refresh claimed some of these since we read them; start over.
+        db.rollback()
+        return _claim(db, limit)
+    return claimed
+
+
+def _increment(db: Session, table, key_column, totals: dict):
+    """Add {key: [units, revenue]} onto a rollup table: one executemany UPDATE, one executemany INSERT."""
+    if not totals:
+        return
+    existing = set(db.scalars(select(key_column).where(key_column.in_(list(totals)))))
+    if existing:
+        db.execute(
+            update(table)
+            .where(key_column == bindparam("b_key"))
+            .values(units=table.c.units + bindparam("b_units"), revenue=table.c.revenue + bindparam("b_revenue")),
+            [
+                {"b_key": key, "b_units": units, "b_revenue": revenue}
+                for key, (units, revenue) in sorted(totals.items()) if key in existing
+            ],
+        )
+    new = [
+        {key_column.name: key, "units": units, "revenue": revenue}
+        for key, (units, revenue) in totals.items() if key not in existing
+    ]
+    if new:
+        db.execute(insert(table), new)
+
+
+def refresh_rollups(db: Session, limit: int = 5000) -> int:
+    """Fold up to limit new order items into the rollups in one transaction. Returns how many were folded."""
+    rows = _claim(db, limit)
+    claimed = [row for row in rows if row.sweet_id is not None]  # items from before sweets had orders
+    if not claimed:
+        db.commit()
+        return len(rows)
+
+    order_ids = {row.order_id for row in claimed}
+    sweet_ids = {row.sweet_id for row in claimed}
+    created = dict(db.execute(select(_orders.c.id, _orders.c.created_at).where(_orders.c.id.in_(order_ids))).all())
+    categories = dict(db.execute(select(_sweets.c.id, _sweets.c.category).where(_sweets.c.id.in_(sweet_ids))).all())
+
+    by_sweet, by_category, hourly, daily = {}, {}, {}, {}
+    for row in claimed:
+        units, revenue = row.quantity, row.quantity * (row.unit_price or 0.0)
+        hour = created[row.order_id].replace(minute=0, second=0, microsecond=0)
+        for totals, key in (
+            (by_sweet, row.sweet_id),
+            (by_category, categories.get(row.sweet_id, UNCATEGORIZED)),
+            (hourly, hour),
+            (daily, hour.date()),
+        ):
+            entry = totals.setdefault(key, [0, 0.0])
+            entry[0] += units
+            entry[1] += revenue
+
+    _increment(db, _by_sweet, _by_sweet.c.sweet_id, by_sweet)
+    _increment(db, _by_category, _by_category.c.category, by_category)
+    _increment(db, _hourly, _hourly.c.hour, hourly)
+    _increment(db, _daily, _daily.c.day, daily)
+    db.commit()
+    return len(rows)
+
+
+def sales_by_sweet(db: Session, sort: str = "revenue", limit: int = 10):
+    """Best-selling sweets by revenue or units."""
+    order = _by_sweet.c.revenue if sort == "revenue" else _by_sweet.c.units
+    return db.execute(
+        select(_by_sweet.c.sweet_id, _sweets.c.name, _by_sweet.c.units, _by_sweet.c.revenue)
+        .outerjoin(_sweets, _sweets.c.id == _by_sweet.c.sweet_id)
+        .order_by(order.desc(), _by_sweet.c.sweet_id)
+        .limit(limit)
+    ).all()
+
+
+def sales_by_category(db: Session):
+    return db.execute(
+        select(_by_category.c.category, _by_category.c.units, _by_category.c.revenue)
+        .order_by(_by_category.c.revenue.desc(), _by_category.c.category)
+    ).all()
+
+
+def sales_over_time(db: Session, granularity: str = "hour", start: datetime | None = None, end: datetime | None = None):
+    """Units and revenue per hour (default: last 48 hours) or per day (default: last 30 days)."""
+    table, column = (_hourly, _hourly.c.hour) if granularity == "hour" else (_daily, _daily.c.day)
+    end = end or datetime.utcnow()
+    start = start or end - (timedelta(hours=48) if granularity == "hour" else timedelta(days=30))
+    if granularity == "day":
+        start, end = start.date(), end.date()
+    return db.execute(
+        select(column.label("period"), table.c.units, table.c.revenue)
+        .where(column >= start, column <= end)
+        .order_by(column)
+    ).all()
@@ -1,21 +1,38 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from . import crud, models
-from .db.session import get_db
-import os
+from . import crud, hashing, models
+from .cache import TTLCache
+from .config import settings
+from .db.session import Base, get_db, run_db
 
-# Use pbkdf2_sha256 to avoid system-native bcrypt dependency issues
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
-SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
+pwd_context = hashing.pwd_context
+SECRET_KEY = settings.secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
+# Resolved principals keyed by token subject, so authenticated requests don't
+# query the users table. Entries are detached snapshots without the password
+# hash; crud invalidates a username whenever that user changes.
+principal_cache = TTLCache(
+    maxsize=settings.principal_cache_size,
+    ttl=settings.principal_cache_ttl,
+)
+
+
+def invalidate_principal(username: str):
+    principal_cache.pop(username)
+
+
+@event.listens_for(Base.metadata, "after_drop")
+def _clear_principal_cache(*args, **kwargs):
+    principal_cache.clear()
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -25,6 +42,30 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+def _hashing_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash in the dedicated hashing pool; 503 when the pool is saturated or keeps breaking."""
+    try:
+        return await hashing.hash_password_async(password)
+    except hashing.HashPoolBusy:
+        raise _hashing_busy()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify in the hashing pool. Returns (valid, new_hash) where new_hash is set if a rehash is due."""
+    try:
+        return await hashing.verify_and_update_async(plain_password, hashed_password)
+    except hashing.HashPoolBusy:
+        raise _hashing_busy()
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -36,7 +77,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -49,13 +90,17 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = crud.get_user_by_username(db, username=username)
+    user = principal_cache.get(username)
     if user is None:
-        raise credentials_exception
+        user = await run_db(db, crud.get_user_by_username, username=username)
+        if user is None:
+            raise credentials_exception
+        user = models.User(id=user.id, username=user.username, full_name=user.full_name, is_admin=user.is_admin)
+        principal_cache.set(username, user)
     return user
 
 
-def get_current_admin(current_user: models.User = Depends(get_current_user)):
+async def get_current_admin(current_user: models.User = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
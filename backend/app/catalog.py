@@ -0,0 +1,290 @@
+"""
+Process-local cache of the sweets catalog.
+
+GET /api/sweets and /api/sweets/search are served from an in-memory snapshot
+of every sweet row. crud records which sweets a transaction touched in
+session.info["changed_sweets"]; after the commit those ids are marked dirty
+and the catalog version is bumped. The next read re-fetches just the dirty
+rows with one indexed query, so a purchase storm costs small refreshes rather
+than full reloads. Reading after the commit means the cache can never hold
+data older than the last committed change it was told about.
+
+Memory is bounded by CATALOG_CACHE_MAX_ROWS: a larger catalog is served from
+the database. Snapshots are fully reloaded after CATALOG_CACHE_TTL seconds,
+which bounds staleness from writes made by other worker processes.
+
+The same version backs the ETags on the catalog list endpoints, so a
+conditional GET is answered with 304 before any query runs, and the same
+changed ids feed the live stock stream (see stream.py).
+"""
+from bisect import bisect_right
+from collections import namedtuple
+import threading
+import time
+import uuid
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from . import crud, models
+from .config import settings
+from .db.session import Base
+from .pagination import InvalidCursor, decode_cursor
+from .search import InvertedIndex
+from .stream import stock_feed
+
+CatalogRow = namedtuple("CatalogRow", ["id", "name", "category", "price", "quantity"])
+RankedRow = namedtuple("RankedRow", CatalogRow._fields + ("relevance",))
+
+CHANGED_SWEETS = "changed_sweets"
+CHANGED_PRODUCTS = "changed_products"
+REFRESH_LIMIT = 1000
+
+
+class CatalogCache:
+    def __init__(self, max_rows: int, ttl: float):
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._rows: dict[int, CatalogRow] | None = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._dirty: set[int] = set()
+        self._orders: dict[str, list[tuple]] = {}
+        self._names: InvertedIndex | None = None
+        self._bypass_until = 0.0
+
+    def invalidate(self, sweet_ids=None):
+        """Mark sweets (or, with no ids, the whole catalog) as changed."""
+        with self._lock:
+            self.version += 1
+            if sweet_ids is None:
+                self._rows = None
+            else:
+                self._dirty.update(sweet_ids)
+
+    def reset(self):
+        with self._lock:
+            self.version += 1
+            self._rows = None
+            self._dirty.clear()
+            self._bypass_until = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.max_rows > 0,
+                "version": self.version,
+                "rows": len(self._rows) if self._rows is not None else 0,
+                "max_rows": self.max_rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+            }
+
+    def _ensure(self, db: Session) -> bool:
+        """Bring the snapshot up to date. Returns False when the database must be used instead."""
+        if self.max_rows <= 0:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if self._rows is None and now < self._bypass_until:
+                return False
+            # A bulk write (e.g. an import) can dirty most of the catalog;
+            # past REFRESH_LIMIT ids one full reload is cheaper than an IN list.
+            expired = (
+                self._rows is None
+                or now - self._loaded_at >= self.ttl
+                or len(self._dirty) > REFRESH_LIMIT
+            )
+            if not expired and not self._dirty:
+                self.hits += 1
+                return True
+            generation = self._generation
+            # Every id marked so far was committed before the query below runs,
+            # so it will see them; anything marked from here on stays dirty.
+            dirty, self._dirty = self._dirty, set()
+
+        if expired:
+            rows = db.execute(
+                select(*crud.SWEET_COLUMNS).order_by(models.Sweet.id).limit(self.max_rows + 1)
+            ).all()
+            with self._lock:
+                self.misses += 1
+                if len(rows) > self.max_rows:
+                    self._rows = None
+                    self._bypass_until = now + self.ttl
+                    return False
+                self._rows = {row.id: CatalogRow(*row) for row in rows}
+                self._loaded_at = now
+                self._generation += 1
+                self._orders.clear()
+                self._names = None
+            return True
+
+        rows = db.execute(select(*crud.SWEET_COLUMNS).where(models.Sweet.id.in_(dirty))).all()
+        with self._lock:
+            self.refreshes += 1
+            if self._generation != generation or self._rows is None:
+                self._dirty.update(dirty)
+                return self._rows is not None
+            self._apply({row.id: CatalogRow(*row) for row in rows}, dirty)
+        return True
+
+    def _apply(self, fetched: dict, ids):
+        reorder = False
+        for sweet_id in ids:
+            old = self._rows.get(sweet_id)
+            new = fetched.get(sweet_id)
+            if new is None:
+                if old is not None:
+                    del self._rows[sweet_id]
+                    reorder = True
+                    if self._names is not None:
+                        self._names.remove(sweet_id)
+                continue
+            self._rows[sweet_id] = new
+            if old is None or old.name != new.name or old.price != new.price:
+                reorder = True
+                if self._names is not None and (old is None or old.name != new.name):
+                    self._names.add(sweet_id, new.name)
+        if reorder:
+            self._orders.clear()
+
+    def _order(self, sort: str) -> list[tuple]:
+        order = self._orders.get(sort)
+        if order is None:
+            order = sorted((getattr(row, sort), row.id) for row in self._rows.values())
+            self._orders[sort] = order
+        return order
+
+    def _name_scores(self, name: str) -> dict[int, float]:
+        if self._names is None:
+            self._names = InvertedIndex()
+            self._names.load((row.id, row.name) for row in self._rows.values())
+        return self._names.search(name)
+
+    @staticmethod
+    def _page(keys: list[tuple], sort: str, cursor, skip: int, limit: int) -> list[tuple]:
+        start = 0
+        if cursor:
+            value, row_id = decode_cursor(cursor, sort)
+            try:
+                start = bisect_right(keys, (value, row_id))
+            except TypeError:
+                raise InvalidCursor("Invalid cursor")
+        return keys[start + skip:start + skip + limit]
+
+    def list_sweets(self, db: Session, skip: int = 0, limit: int = 100, cursor: str | None = None, sort: str = "id"):
+        if self._ensure(db):
+            with self._lock:
+                if self._rows is not None:
+                    keys = self._page(self._order(sort), sort, cursor, skip, limit)
+                    return [self._rows[row_id] for _, row_id in keys]
+        return crud.list_sweets(db, skip=skip, limit=limit, cursor=cursor, sort=sort)
+
+    def search_sweets(
+        self,
+        db: Session,
+        name: str = None,
+        category: str = None,
+        min_price: float = None,
+        max_price: float = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: str | None = None,
+        sort: str = "id"
+    ):
+        if self._ensure(db):
+            with self._lock:
+                if self._rows is not None:
+                    return self._search(name, category, min_price, max_price, skip, limit, cursor, sort)
+        return crud.search_sweets(
+            db, name=name, category=category, min_price=min_price, max_price=max_price,
+            skip=skip, limit=limit, cursor=cursor, sort=sort,
+        )
+
+    def _search(self, name, category, min_price, max_price, skip, limit, cursor, sort):
+        def wanted(row):
+            return (
+                (not category or row.category == category)
+                and (min_price is None or row.price >= min_price)
+                and (max_price is None or row.price <= max_price)
+            )
+
+        scores = self._name_scores(name) if name else None
+        if sort == "relevance" and scores is not None:
+            # Same convention as the database path: lower rank is more relevant.
+            keys = sorted(
+                (-score, row_id) for row_id, score in scores.items() if wanted(self._rows[row_id])
+            )
+            return [
+                RankedRow(*self._rows[row_id], relevance=rank)
+                for rank, row_id in self._page(keys, sort, cursor, skip, limit)
+            ]
+        if sort == "relevance":
+            sort = "id"
+        keys = [
+            key for key in self._order(sort)
+            if (scores is None or key[1] in scores) and wanted(self._rows[key[1]])
+        ]
+        return [self._rows[row_id] for _, row_id in self._page(keys, sort, cursor, skip, limit)]
+
+
+catalog_cache = CatalogCache(
+    max_rows=settings.catalog_cache_max_rows,
+    ttl=settings.catalog_cache_ttl,
+)
+
+
+# Catalog ETags. A tag is only ever compared with tags from the same process
+# (boot id), changes on every committed write here (version), and rotates
+# every CATALOG_CACHE_TTL seconds (epoch) so writes made by other worker
+# processes are picked up within the same bound as the cache itself.
+_boot_id = uuid.uuid4().hex[:12]
+_product_version = 0
+_product_version_lock = threading.Lock()
+
+
+def _bump_product_version():
+    global _product_version
+    with _product_version_lock:
+        _product_version += 1
+
+
+def etag(resource: str) -> str:
+    version = catalog_cache.version if resource == "sweets" else _product_version
+    epoch = int(time.monotonic() // max(settings.catalog_cache_ttl, 1.0))
+    return f'"{_boot_id}-{resource}-{version}-{epoch}"'
+
+
+def list_sweets(db: Session, **kwargs):
+    return catalog_cache.list_sweets(db, **kwargs)
+
+
+def search_sweets(db: Session, **kwargs):
+    return catalog_cache.search_sweets(db, **kwargs)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    changed = session.info.pop(CHANGED_SWEETS, None)
+    if changed:
+        catalog_cache.invalidate(changed)
+        stock_feed.notify(changed)
+    if session.info.pop(CHANGED_PRODUCTS, None):
+        _bump_product_version()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(CHANGED_SWEETS, None)
+    session.info.pop(CHANGED_PRODUCTS, None)
+
+
+@event.listens_for(Base.metadata, "after_drop")
+def _reset_catalog(*args, **kwargs):
+    catalog_cache.reset()
+    _bump_product_version()
@@ -0,0 +1,78 @@
+import os
+from typing import Literal
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    Runtime configuration, read from environment variables (case-insensitive,
+    e.g. DATABASE_URL, DB_POOL_SIZE) or a local .env file.
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    database_url: str = "sqlite:///./dev.db"
+    async_db: bool = False
+    secret_key: str = "dev-secret"
+
+    # Connection pool (ignored for in-memory SQLite, which uses one shared connection)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+
+    # SQLite pragmas applied to every new connection
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 16384
+
+    # "counter" updates sweets.quantity in place; "ledger" appends stock_ledger deltas
+    # that a background job compacts every LEDGER_COMPACT_INTERVAL seconds
+    inventory_mode: Literal["counter", "ledger"] = "counter"
+    ledger_compact_interval: float = 5.0
+    ledger_compact_batch: int = 5000
+
+    # Sales rollups behind /api/admin/analytics; 0 disables the background refresh
+    rollup_refresh_interval: float = 10.0
+    rollup_refresh_batch: int = 5000
+
+    # "auto" picks SQLite FTS5 / PostgreSQL full-text by dialect; "memory" forces the in-process index,
+    # which each worker reloads every SEARCH_INDEX_TTL seconds to pick up the others' writes
+    search_backend: str = "auto"
+    search_index_ttl: float = 30.0
+
+    # In-memory sweets catalog; 0 rows disables it
+    catalog_cache_max_rows: int = 50000
+    catalog_cache_ttl: float = 30.0
+
+    # GET /api/sweets/stream: messages buffered per client before it is dropped, and
+    # seconds between keepalive comments on an idle stream
+    stream_client_buffer: int = 100
+    stream_heartbeat_interval: float = 15.0
+
+    # Prometheus metrics at GET /metrics (scrape it from inside the network)
+    metrics_enabled: bool = True
+
+    # Per-request SQL stats in a Server-Timing header; statements slower than SLOW_QUERY_MS and
+    # statements a single request repeats REPEATED_QUERY_WARN times are logged on "app.sql"
+    server_timing_enabled: bool = True
+    slow_query_ms: float = 200.0
+    repeated_query_warn: int = 10
+
+    principal_cache_size: int = 1024
+    principal_cache_ttl: float = 60.0
+
+    # Idempotency-Key results are kept this long (seconds); recent ones are also cached in memory
+    idempotency_ttl: float = 86400.0
+    idempotency_cache_size: int = 10000
+    idempotency_cache_ttl: float = 300.0
+
+    password_hash_rounds: int = 29000
+    password_hash_workers: int = Field(default_factory=lambda: max(1, (os.cpu_count() or 2) // 2))
+    password_hash_queue: int = 32
+
+
+settings = Settings()
@@ -1,34 +1,105 @@
+from datetime import datetime
+import random
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from . import models, schemas
-from .auth import get_password_hash
+from sqlalchemy import DateTime, and_, or_, bindparam, false, func, insert, literal, select, union, update
+from . import models, schemas, search
+from .config import settings
+from .auth import get_password_hash, invalidate_principal
+from .pagination import paginate
 
 
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 
-def create_user(db: Session, user: schemas.UserCreate, is_admin: bool = False):
-    db_user = models.User(username=user.username, hashed_password=get_password_hash(user.password), full_name=user.full_name, is_admin=is_admin)
+def create_user(db: Session, user: schemas.UserCreate, is_admin: bool = False, hashed_password: str | None = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
+    db_user = models.User(username=user.username, hashed_password=hashed_password, full_name=user.full_name, is_admin=is_admin)
     db.add(db_user)
     db.commit()
+    invalidate_principal(user.username)
     db.refresh(db_user)
     return db_user
 
 
+def update_user_password_hash(db: Session, user_id: int, hashed_password: str):
+    """Store a new password hash, e.g. after a login rehash at a higher cost."""
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {"hashed_password": hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(name=product.name, description=product.description, price=product.price)
     db.add(db_product)
+    db.info["changed_products"] = True
     db.commit()
     db.refresh(db_product)
     return db_product
 
 
-def list_products(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Product).offset(skip).limit(limit).all()
+PRODUCT_COLUMNS = (
+    models.Product.id,
+    models.Product.name,
+    models.Product.description,
+    models.Product.price,
+)
+
+
+def list_products(db: Session, skip: int = 0, limit: int = 100, cursor: str | None = None, sort: str = "id"):
+    query = db.query(*PRODUCT_COLUMNS)
+    return paginate(query, getattr(models.Product, sort), models.Product.id, sort, cursor, skip, limit).all()
 
 
 # Sweet (Sweets) CRUD operations
+#
+# Reads that feed SweetResponse select plain rows. "quantity" is the exact
+# stock: sweets.quantity plus any sharded stock buckets (see shard_sweet_stock)
+# plus ledger deltas not yet compacted (see compact_ledger).
+_bucket_stock = (
+    select(func.coalesce(func.sum(models.SweetStockBucket.quantity), 0))
+    .where(models.SweetStockBucket.sweet_id == models.Sweet.id)
+    .correlate(models.Sweet)
+    .scalar_subquery()
+)
+_ledger_stock = (
+    select(func.coalesce(func.sum(models.StockLedgerEntry.delta), 0))
+    .where(models.StockLedgerEntry.sweet_id == models.Sweet.id, models.StockLedgerEntry.compacted == false())
+    .correlate(models.Sweet)
+    .scalar_subquery()
+)
+
+_sweets = models.Sweet.__table__
+_ledger = models.StockLedgerEntry.__table__
+
+SWEET_COLUMNS = (
+    models.Sweet.id,
+    models.Sweet.name,
+    models.Sweet.category,
+    models.Sweet.price,
+    (models.Sweet.quantity + _bucket_stock + _ledger_stock).label("quantity"),
+)
+
+
+def _touch(db: Session, *sweet_ids: int):
+    """Record sweets changed by this transaction; the catalog cache refreshes them after commit."""
+    db.info.setdefault("changed_sweets", set()).update(sweet_ids)
+
+
+def _commit(db: Session, result, *sweet_ids: int):
+    """
+    Touch sweet_ids and commit, leaving result in session.info["commit_result"]
+    for before_commit listeners (idempotency keys store it in the same
+    transaction). Returns result.
+    """
+    _touch(db, *sweet_ids)
+    db.info["commit_result"] = result
+    db.commit()
+    return result
+
+
 def create_sweet(db: Session, sweet: schemas.SweetCreate) -> models.Sweet:
     """Create a new sweet in the database."""
     db_sweet = models.Sweet(
@@ -38,14 +109,18 @@ def create_sweet(db: Session, sweet: schemas.SweetCreate) -> models.Sweet:
         quantity=sweet.quantity
     )
     db.add(db_sweet)
+    db.flush()
+    search.index_sweet(db, db_sweet.id, db_sweet.name)
+    _touch(db, db_sweet.id)
     db.commit()
     db.refresh(db_sweet)
     return db_sweet
 
 
-def list_sweets(db: Session, skip: int = 0, limit: int = 100) -> list[models.Sweet]:
-    """List all sweets with pagination."""
-    return db.query(models.Sweet).offset(skip).limit(limit).all()
+def list_sweets(db: Session, skip: int = 0, limit: int = 100, cursor: str | None = None, sort: str = "id"):
+    """List all sweets in stable (sort, id) order, paged by cursor and/or skip/limit."""
+    query = db.query(*SWEET_COLUMNS)
+    return paginate(query, getattr(models.Sweet, sort), models.Sweet.id, sort, cursor, skip, limit).all()
 
 
 def search_sweets(
@@ -55,14 +130,26 @@ def search_sweets(
     min_price: float = None,
     max_price: float = None,
     skip: int = 0,
-    limit: int = 100
-) -> list[models.Sweet]:
-    """Search sweets with optional filters for name, category, and price range."""
-    query = db.query(models.Sweet)
+    limit: int = 100,
+    cursor: str | None = None,
+    sort: str = "id"
+):
+    """
+    Search sweets with optional filters for name, category, and price range.
+    The name filter uses the full-text index (word prefixes, case-insensitive);
+    sort="relevance" orders name matches by rank.
+    """
+    query = db.query(*SWEET_COLUMNS)
+    sort_column = getattr(models.Sweet, sort, models.Sweet.id)
     
-    # Apply name filter (case-insensitive)
+    # Apply name filter (full-text, case-insensitive)
     if name:
-        query = query.filter(models.Sweet.name.ilike(f"%{name}%"))
+        query, relevance = search.match(db, query, name)
+        if sort == "relevance":
+            query = query.add_columns(relevance.label("relevance"))
+            sort_column = relevance
+    elif sort == "relevance":
+        sort = "id"
     
     # Apply category filter (exact match)
     if category:
@@ -74,55 +161,165 @@ def search_sweets(
     if max_price is not None:
         query = query.filter(models.Sweet.price <= max_price)
     
-    return query.offset(skip).limit(limit).all()
+    return paginate(query, sort_column, models.Sweet.id, sort, cursor, skip, limit).all()
 
 
 # Inventory operations
-def purchase_sweet(db: Session, sweet_id: int):
+#
+# Stock and price changes are single conditional UPDATE statements. The WHERE
+# clause carries the stock check, so the database applies check-and-decrement
+# atomically and holds the row lock only for the duration of that statement,
+# on every backend (SQLite ignores SELECT ... FOR UPDATE). Where the dialect
+# supports UPDATE ... RETURNING the new row comes back in the same round trip.
+def _update_sweet(db: Session, sweet_id: int, values: dict, *conditions):
+    """
+    Apply one conditional UPDATE to a sweet and return the updated row,
+    or None if no row matched (missing sweet or a failed condition).
+    """
+    stmt = (
+        update(models.Sweet)
+        .where(models.Sweet.id == sweet_id, *conditions)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if db.get_bind().dialect.update_returning:
+        return db.execute(stmt.returning(*SWEET_COLUMNS)).first()
+    # Fallback: the UPDATE already holds the row lock, so the follow-up
+    # SELECT in the same transaction sees exactly what we wrote.
+    if db.execute(stmt).rowcount == 0:
+        return None
+    return _sweet_row(db, sweet_id)
+
+
+def _sweet_row(db: Session, sweet_id: int):
+    return db.execute(select(*SWEET_COLUMNS).where(models.Sweet.id == sweet_id)).first()
+
+
+def _stock_levels(db: Session, sweet_ids) -> dict[int, int]:
+    rows = db.execute(
+        select(models.Sweet.id, SWEET_COLUMNS[-1]).where(models.Sweet.id.in_(list(sweet_ids)))
+    )
+    return {sweet_id: quantity for sweet_id, quantity in rows}
+
+
+def _take_stock(db: Session, sweet_id: int, quantity: int):
+    """
+    Remove stock from a sweet inside the current transaction.
+    Returns the updated sweet row, or None if it is missing or short.
     """
-    Purchase a sweet by decreasing its quantity by 1.
-    Uses pessimistic row-level locking to prevent overselling under concurrent load.
+    if settings.inventory_mode == "ledger":
+        return _append_delta(db, sweet_id, -quantity, "purchase")
+    sweet = _update_sweet(
+        db, sweet_id,
+        {"quantity": models.Sweet.quantity - quantity},
+        models.Sweet.quantity >= quantity,
+    )
+    if sweet is None and _take_from_buckets(db, sweet_id, quantity):
+        sweet = _sweet_row(db, sweet_id)
+    return sweet
+
+
+def purchase_sweet(db: Session, sweet_id: int, quantity: int = 1):
+    """
+    Purchase a sweet by decreasing its quantity (1 by default).
+    A single conditional UPDATE (quantity >= requested) prevents overselling
+    under concurrent load without a separate locking read.
     Returns:
         (sweet, None) - on success
         (None, "not_found") - if sweet doesn't exist
-        (None, "out_of_stock") - if quantity is 0
+        (None, "out_of_stock") - if quantity is insufficient
     """
-    # Acquire exclusive row lock to serialize concurrent purchases
-    sweet = db.query(models.Sweet).filter(
-        models.Sweet.id == sweet_id
-    ).with_for_update().first()
-    
-    if not sweet:
-        return None, "not_found"
-    
-    if sweet.quantity <= 0:
+    sweet = _take_stock(db, sweet_id, quantity)
+    if sweet is None:
+        db.rollback()
+        if not _stock_levels(db, [sweet_id]):
+            return None, "not_found"
         return None, "out_of_stock"
-    
-    sweet.quantity -= 1
-    db.commit()
-    db.refresh(sweet)
-    return sweet, None
+    return _commit(db, sweet, sweet_id), None
+
+
+def purchase_sweets(db: Session, lines: list[tuple[int, int]]):
+    """
+    Purchase several sweets in one transaction, all or nothing.
+    Quantities for repeated sweet ids are summed, and rows are updated in id
+    order so concurrent multi-item purchases cannot deadlock each other.
+    Returns:
+        (sweets, None) - on success, updated sweets in request order
+        (missing_ids, "not_found") - if any sweet doesn't exist
+        (shortages, "out_of_stock") - if any line exceeds the available stock;
+            each shortage is {"sweet_id", "requested", "available"}
+    """
+    wanted = _merge_quantities(lines)
+    updated, error = _take_lines(db, wanted)
+    if error:
+        return updated, error
+    return _commit(db, [updated[sweet_id] for sweet_id in wanted], *wanted), None
+
+
+def _merge_quantities(lines) -> dict[int, int]:
+    merged: dict[int, int] = {}
+    for sweet_id, quantity in lines:
+        merged[sweet_id] = merged.get(sweet_id, 0) + quantity
+    return merged
+
+
+def _take_lines(db: Session, wanted: dict[int, int]):
+    """
+    Take stock for every line in id order (see purchase_sweets). Returns
+    ({sweet_id: row}, None), or rolls back and returns the failure result.
+    """
+    updated = {}
+    for sweet_id in sorted(wanted):
+        sweet = _take_stock(db, sweet_id, wanted[sweet_id])
+        if sweet is None:
+            db.rollback()
+            return _purchase_failure(db, wanted, failed_id=sweet_id)
+        updated[sweet_id] = sweet
+    return updated, None
+
+
+def _purchase_failure(db: Session, wanted: dict[int, int], failed_id: int):
+    """Build the (details, error) result for a rolled-back multi-item purchase."""
+    available = _stock_levels(db, wanted)
+    missing = [sweet_id for sweet_id in wanted if sweet_id not in available]
+    if missing:
+        return missing, "not_found"
+    shortages = [
+        {"sweet_id": sweet_id, "requested": quantity, "available": available[sweet_id]}
+        for sweet_id, quantity in wanted.items()
+        # The failed line is always reported, even if a concurrent restock
+        # has topped it up since our UPDATE missed.
+        if available[sweet_id] < quantity or sweet_id == failed_id
+    ]
+    return shortages, "out_of_stock"
+
+
+def _add_stock(db: Session, sweet_id: int, quantity: int):
+    """Add stock to a sweet inside the current transaction. Returns the updated row, or None if missing."""
+    if settings.inventory_mode == "ledger":
+        return _append_delta(db, sweet_id, quantity, "restock")
+    buckets = _bucket_ids(db, sweet_id)
+    if buckets:
+        _add_to_buckets(db, sweet_id, buckets, quantity)
+        return _sweet_row(db, sweet_id)
+    return _update_sweet(db, sweet_id, {"quantity": models.Sweet.quantity + quantity})
 
 
 def restock_sweet(db: Session, sweet_id: int, quantity: int):
     """
     Restock a sweet by increasing its quantity by the given amount.
-    Uses pessimistic row-level locking to ensure consistency under concurrent operations.
+    The increment happens inside the UPDATE, so concurrent restocks and
+    purchases never lose each other's changes.
     Returns:
         (sweet, None) - on success
         (None, "not_found") - if sweet doesn't exist
     """
-    # Acquire exclusive row lock to prevent lost updates during concurrent restock/purchase
-    sweet = db.query(models.Sweet).filter(
-        models.Sweet.id == sweet_id
-    ).with_for_update().first()
-    
-    if not sweet:
+    sweet = _add_stock(db, sweet_id, quantity)
+    if sweet is None:
+        db.rollback()
         return None, "not_found"
-    
-    sweet.quantity += quantity
+    _touch(db, sweet_id)
     db.commit()
-    db.refresh(sweet)
     return sweet, None
 
 
@@ -130,22 +327,434 @@ def update_sweet_price(db: Session, sweet_id: int, price: float):
     """
     Update a sweet's price. Returns (sweet, error) where error can be "not_found".
     """
+    sweet = _update_sweet(db, sweet_id, {"price": price})
+    if sweet is None:
+        db.rollback()
+        return None, "not_found"
+    _touch(db, sweet_id)
+    db.commit()
+    return sweet, None
+
+
+def _apply_batch(db: Session, changes: dict, apply):
+    """
+    Run apply(db, sweet_id, value) for every change in one transaction, in id
+    order so concurrent batches lock rows in the same sequence and cannot
+    deadlock. All or nothing: returns (rows in request order, None), or
+    (missing_ids, "not_found") after rolling back.
+    """
+    updated = {}
+    for sweet_id in sorted(changes):
+        sweet = apply(db, sweet_id, changes[sweet_id])
+        if sweet is None:
+            db.rollback()
+            found = _stock_levels(db, changes)
+            return [sweet_id for sweet_id in changes if sweet_id not in found], "not_found"
+        updated[sweet_id] = sweet
+    _touch(db, *changes)
+    db.commit()
+    return [updated[sweet_id] for sweet_id in changes], None
+
+
+def restock_sweets(db: Session, lines: list[tuple[int, int]]):
+    """Restock several sweets at once; quantities for repeated ids are summed. See _apply_batch."""
+    return _apply_batch(db, _merge_quantities(lines), _add_stock)
+
+
+def update_sweet_prices(db: Session, lines: list[tuple[int, float]]):
+    """Set the price of several sweets at once; the last price for a repeated id wins. See _apply_batch."""
+    changes = dict(lines)
+    return _apply_batch(db, changes, lambda db, sweet_id, price: _update_sweet(db, sweet_id, {"price": price}))
+
+
+# Orders
+#
+# A checkout is one transaction: stock is taken line by line exactly as in
+# purchase_sweets, then the order row and all of its items are inserted (the
+# items with a single executemany) and everything commits together.
+_orders = models.Order.__table__
+_order_items = models.OrderItem.__table__
+
+
+def _order_view(order_id: int, user_id: int, created_at, items: list[dict]) -> dict:
+    return {
+        "id": order_id,
+        "user_id": user_id,
+        "created_at": created_at,
+        "items": items,
+        "total": round(sum(item["quantity"] * item["unit_price"] for item in items), 2),
+    }
+
+
+def create_order(db: Session, user_id: int, lines: list[tuple[int, int]]):
+    """
+    Check out an order of (sweet_id, quantity) lines; repeated sweets are merged.
+    Each item records the sweet's price at checkout. All or nothing.
+    Returns:
+        (order, None) - on success
+        (missing_ids, "not_found") / (shortages, "out_of_stock") - as purchase_sweets
+    """
+    wanted = _merge_quantities(lines)
+    taken, error = _take_lines(db, wanted)
+    if error:
+        return taken, error
+
+    order = models.Order(user_id=user_id)
+    db.add(order)
+    db.flush()
+    items = [
+        {"sweet_id": sweet_id, "quantity": quantity, "unit_price": taken[sweet_id].price}
+        for sweet_id, quantity in wanted.items()
+    ]
+    db.execute(insert(_order_items), [{"order_id": order.id, **item} for item in items])
+    view = _order_view(order.id, user_id, order.created_at, items)
+    return _commit(db, view, *wanted), None
+
+
+def get_order(db: Session, order_id: int) -> dict | None:
+    """Order with its items, or None if it doesn't exist."""
+    order = db.execute(
+        select(_orders.c.id, _orders.c.user_id, _orders.c.created_at).where(_orders.c.id == order_id)
+    ).first()
+    if order is None:
+        return None
+    items = db.execute(
+        select(_order_items.c.sweet_id, _order_items.c.quantity, _order_items.c.unit_price)
+        .where(_order_items.c.order_id == order_id)
+        .order_by(_order_items.c.id)
+    ).mappings().all()
+    return _order_view(order.id, order.user_id, order.created_at, [dict(item) for item in items])
+
+
+# Sharded ("escrow bucket") stock for hot sweets
+#
+# A sharded sweet keeps its stock in N sweet_stock_buckets rows instead of
+# sweets.quantity, so concurrent purchases lock different rows. A purchase
+# tries the buckets that have enough stock in random order; only when none can
+# cover it are all buckets locked and the total redistributed evenly.
+_buckets = models.SweetStockBucket.__table__
+
+
+def _spread(total: int, parts: int) -> list[int]:
+    """Split total into parts that differ by at most one, larger parts first."""
+    share, extra = divmod(total, parts)
+    return [share + 1 if i < extra else share for i in range(parts)]
+
+
+def _bucket_ids(db: Session, sweet_id: int) -> list[int]:
+    return db.execute(
+        select(models.SweetStockBucket.bucket).where(models.SweetStockBucket.sweet_id == sweet_id)
+    ).scalars().all()
+
+
+def _set_buckets(db: Session, sweet_id: int, quantities: list[int]):
+    db.execute(
+        update(_buckets)
+        .where(_buckets.c.sweet_id == sweet_id, _buckets.c.bucket == bindparam("b_bucket"))
+        .values(quantity=bindparam("b_quantity")),
+        [{"b_bucket": bucket, "b_quantity": quantity} for bucket, quantity in enumerate(quantities)],
+    )
+
+
+def _add_to_buckets(db: Session, sweet_id: int, buckets: list[int], quantity: int):
+    # Rotate the split so remainders don't always land on the same buckets.
+    shares = _spread(quantity, len(buckets))
+    offset = random.randrange(len(buckets))
+    db.execute(
+        update(_buckets)
+        .where(_buckets.c.sweet_id == sweet_id, _buckets.c.bucket == bindparam("b_bucket"))
+        .values(quantity=_buckets.c.quantity + bindparam("b_delta")),
+        [
+            {"b_bucket": bucket, "b_delta": shares[(i + offset) % len(shares)]}
+            for i, bucket in enumerate(sorted(buckets))
+        ],
+    )
+
+
+def _take_from_buckets(db: Session, sweet_id: int, quantity: int) -> bool:
+    """Take stock from a sharded sweet's buckets. Returns False if short or not sharded."""
+    levels = db.execute(
+        select(models.SweetStockBucket.bucket, models.SweetStockBucket.quantity)
+        .where(models.SweetStockBucket.sweet_id == sweet_id)
+    ).all()
+    if not levels:
+        return False
+
+    candidates = [bucket for bucket, available in levels if available >= quantity]
+    random.shuffle(candidates)
+    for bucket in candidates:
+        taken = db.execute(
+            update(models.SweetStockBucket)
+            .where(
+                models.SweetStockBucket.sweet_id == sweet_id,
+                models.SweetStockBucket.bucket == bucket,
+                models.SweetStockBucket.quantity >= quantity,
+            )
+            .values(quantity=models.SweetStockBucket.quantity - quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if taken.rowcount:
+            return True
+
+    # No single bucket can cover the purchase: lock them all and rebalance.
+    locked = db.execute(
+        select(models.SweetStockBucket.quantity)
+        .where(models.SweetStockBucket.sweet_id == sweet_id)
+        .order_by(models.SweetStockBucket.bucket)
+        .with_for_update()
+    ).scalars().all()
+    total = sum(locked)
+    if total < quantity:
+        return False
+    _set_buckets(db, sweet_id, _spread(total - quantity, len(locked)))
+    return True
+
+
+def shard_sweet_stock(db: Session, sweet_id: int, buckets: int):
+    """
+    Switch a sweet to sharded stock with the given number of buckets, or back
+    to a single counter when buckets is 0. Existing stock is carried over.
+    Returns (sweet, error) where error can be "not_found", or "ledger_mode"
+    because sharding and the ledger are alternative ways to spread writes.
+    """
     sweet = db.query(models.Sweet).filter(models.Sweet.id == sweet_id).with_for_update().first()
     if not sweet:
         return None, "not_found"
-    sweet.price = price
+    if settings.inventory_mode == "ledger":
+        db.rollback()
+        return None, "ledger_mode"
+    current = db.query(models.SweetStockBucket).filter(
+        models.SweetStockBucket.sweet_id == sweet_id
+    ).order_by(models.SweetStockBucket.bucket).with_for_update().all()
+    total = sweet.quantity + sum(bucket.quantity for bucket in current)
+
+    for bucket in current:
+        db.delete(bucket)
+    db.flush()
+    if buckets:
+        db.add_all(
+            models.SweetStockBucket(sweet_id=sweet_id, bucket=i, quantity=quantity)
+            for i, quantity in enumerate(_spread(total, buckets))
+        )
+        sweet.quantity = 0
+    else:
+        sweet.quantity = total
+    _touch(db, sweet_id)
     db.commit()
-    db.refresh(sweet)
-    return sweet, None
+    return _sweet_row(db, sweet_id), None
+
+
+# Low stock
+#
+# ix_sweets_low_stock indexes exactly the sweets whose sweets.quantity is at
+# or below their reorder_threshold; the purchase UPDATE keeps it current in the
+# same transaction. Sharded sweets (sweets.quantity = 0) are always in it, and
+# sweets with pending ledger deltas are added from the ledger's own partial
+# index, so the exact total is only computed for that small candidate set.
+LOW_STOCK_COLUMNS = SWEET_COLUMNS + (models.Sweet.reorder_threshold,)
+
+
+def set_reorder_threshold(db: Session, sweet_id: int, threshold: int | None):
+    """
+    Set (or with None, clear) a sweet's restock alert level.
+    Returns (sweet, error) where error can be "not_found".
+    """
+    updated = db.execute(
+        update(models.Sweet)
+        .where(models.Sweet.id == sweet_id)
+        .values(reorder_threshold=threshold)
+        .execution_options(synchronize_session=False)
+    )
+    if updated.rowcount == 0:
+        db.rollback()
+        return None, "not_found"
+    db.commit()
+    return db.execute(select(*LOW_STOCK_COLUMNS).where(models.Sweet.id == sweet_id)).first(), None
+
+
+def list_low_stock(db: Session, limit: int = 100):
+    """Sweets at or below their reorder threshold, furthest below first."""
+    quantity = SWEET_COLUMNS[-1]
+    candidates = union(
+        select(models.Sweet.id).where(models.Sweet.quantity <= models.Sweet.reorder_threshold),
+        select(_ledger.c.sweet_id).where(_ledger.c.compacted == false()),
+    )
+    return db.execute(
+        select(*LOW_STOCK_COLUMNS)
+        .where(models.Sweet.id.in_(candidates), quantity <= models.Sweet.reorder_threshold)
+        .order_by(quantity - models.Sweet.reorder_threshold, models.Sweet.id)
+        .limit(limit)
+    ).all()
+
+
+# Inventory ledger (INVENTORY_MODE=ledger)
+#
+# Purchases and restocks append stock_ledger rows instead of updating
+# sweets.quantity, so they never wait on the sweet's row lock and every
+# change is kept. A purchase is an INSERT ... SELECT whose WHERE clause checks
+# the current stock, so the check and the append are one statement; on
+# PostgreSQL a per-sweet transaction-scoped advisory lock serializes
+# concurrent purchases of the same sweet (SQLite already has a single writer).
+# compact_ledger folds deltas into sweets.quantity in the background.
+LEDGER_LOCK_CLASS = 7031
+
+
+def _append_delta(db: Session, sweet_id: int, delta: int, reason: str):
+    """Append a stock delta if the sweet exists and has enough stock. Returns the updated row or None."""
+    dialect = db.get_bind().dialect
+    if delta < 0 and dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(LEDGER_LOCK_CLASS, sweet_id)))
+    stock = select(SWEET_COLUMNS[-1]).where(models.Sweet.id == sweet_id).scalar_subquery()
+    entry = select(
+        literal(sweet_id), literal(delta), literal(reason), literal(datetime.utcnow(), DateTime), false()
+    ).where(stock >= max(-delta, 0))
+    inserted = db.execute(
+        insert(_ledger).from_select(["sweet_id", "delta", "reason", "created_at", "compacted"], entry)
+    )
+    if inserted.rowcount == 0:
+        return None
+    return _sweet_row(db, sweet_id)
+
+
+def compact_ledger(db: Session, limit: int = 5000) -> int:
+    """
+    Fold up to limit pending ledger deltas into sweets.quantity and mark them
+    compacted, in one transaction; visible stock doesn't change. Returns the
+    number of deltas folded. Safe to run from several workers at once: each
+    delta is claimed by exactly one UPDATE.
+    """
+    pending = (
+        select(_ledger.c.id).where(_ledger.c.compacted == false()).order_by(_ledger.c.id).limit(limit)
+    )
+    claim = update(_ledger).where(_ledger.c.id.in_(pending), _ledger.c.compacted == false()).values(compacted=True)
+    if db.get_bind().dialect.update_returning:
+        claimed = db.execute(claim.returning(_ledger.c.sweet_id, _ledger.c.delta)).all()
+    else:
+        ids = db.scalars(pending).all()
+        claimed = db.execute(select(_ledger.c.sweet_id, _ledger.c.delta).where(_ledger.c.id.in_(ids))).all()
+        marked = db.execute(
+            update(_ledger).where(_ledger.c.id.in_(ids), _ledger.c.compacted == false()).values(compacted=True)
+        )
+        if marked.rowcount != len(ids):
+            # Another compactor claimed some of these since we read them; start over.
+            db.rollback()
+            return compact_ledger(db, limit)
+    totals: dict[int, int] = {}
+    for sweet_id, delta in claimed:
+        totals[sweet_id] = totals.get(sweet_id, 0) + delta
+    if totals:
+        db.execute(
+            update(_sweets)
+            .where(_sweets.c.id == bindparam("b_id"))
+            .values(quantity=_sweets.c.quantity + bindparam("b_delta")),
+            [{"b_id": sweet_id, "b_delta": delta} for sweet_id, delta in sorted(totals.items())],
+        )
+    db.commit()
+    return len(claimed)
+
+
+def list_ledger(db: Session, sweet_id: int, limit: int = 100):
+    """Most recent ledger entries for a sweet, newest first."""
+    return db.execute(
+        select(_ledger.c.id, _ledger.c.delta, _ledger.c.reason, _ledger.c.created_at, _ledger.c.compacted)
+        .where(_ledger.c.sweet_id == sweet_id)
+        .order_by(_ledger.c.id.desc())
+        .limit(limit)
+    ).all()
 
 
 def delete_sweet(db: Session, sweet_id: int):
     """
     Delete a sweet by id. Returns (True, None) on success or (False, "not_found").
+    Its order lines and ledger history are kept with sweet_id set to NULL.
     """
     sweet = db.query(models.Sweet).filter(models.Sweet.id == sweet_id).first()
     if not sweet:
         return False, "not_found"
+    db.query(models.SweetStockBucket).filter(
+        models.SweetStockBucket.sweet_id == sweet_id
+    ).delete(synchronize_session=False)
+    # The foreign keys say ON DELETE SET NULL, but tables created before they
+    # did would refuse the DELETE, so detach the rows explicitly.
+    for table in (_order_items, _ledger):
+        db.execute(update(table).where(table.c.sweet_id == sweet_id).values(sweet_id=None))
+    search.remove_sweet(db, sweet_id)
     db.delete(sweet)
+    _touch(db, sweet_id)
     db.commit()
     return True, None
+
+
+# Bulk import
+#
+# Writes one chunk of validated sweets matched on name, in one transaction:
+# one SELECT finds the existing rows, then one executemany UPDATE and one
+# executemany INSERT write the chunk. Imported quantities replace the stock;
+# for sharded sweets it is spread over the existing buckets.
+#
+# The match is best effort, not an atomic upsert: sweet names are not unique
+# (POST /api/sweets accepts duplicates), so there is no conflict target for
+# INSERT ... ON CONFLICT. Two imports, or an import and a create, running at
+# once can each insert the same name, and a name that is already duplicated
+# only has its oldest row (lowest id) updated.
+
+
+def import_sweets(db: Session, sweets: list[schemas.SweetCreate]) -> tuple[int, int]:
+    """
+    Insert sweets whose name is new and update the oldest sweet of each known
+    name (best effort, see above), then commit. Returns (inserted, updated).
+    """
+    by_name = {sweet.name: sweet for sweet in sweets}  # later rows for the same name win
+    existing = dict(
+        db.execute(
+            select(_sweets.c.name, func.min(_sweets.c.id))
+            .where(_sweets.c.name.in_(list(by_name)))
+            .group_by(_sweets.c.name)
+        ).all()
+    )
+
+    if existing:
+        db.execute(
+            update(_sweets)
+            .where(_sweets.c.id == bindparam("b_id"))
+            .values(category=bindparam("b_category"), price=bindparam("b_price"), quantity=bindparam("b_quantity")),
+            [
+                {"b_id": existing[name], "b_category": sweet.category, "b_price": sweet.price, "b_quantity": sweet.quantity}
+                for name, sweet in by_name.items() if name in existing
+            ],
+        )
+        # Imported quantities replace the stock, pending ledger deltas included.
+        db.execute(
+            update(_ledger)
+            .where(_ledger.c.sweet_id.in_(list(existing.values())), _ledger.c.compacted == false())
+            .values(compacted=True)
+        )
+        sharded = dict(
+            db.execute(
+                select(_buckets.c.sweet_id, func.count())
+                .where(_buckets.c.sweet_id.in_(list(existing.values())))
+                .group_by(_buckets.c.sweet_id)
+            ).all()
+        )
+        for name, sweet_id in existing.items():
+            if sweet_id in sharded:
+                _set_buckets(db, sweet_id, _spread(by_name[name].quantity, sharded[sweet_id]))
+                db.execute(update(_sweets).where(_sweets.c.id == sweet_id).values(quantity=0))
+
+    new = [sweet for name, sweet in by_name.items() if name not in existing]
+    created = []
+    if new:
+        rows = [sweet.model_dump() for sweet in new]
+        if db.get_bind().dialect.insert_executemany_returning:
+            # Only our own rows, even if another writer inserted one of these names meanwhile.
+            created = db.execute(insert(_sweets).returning(_sweets.c.id, _sweets.c.name), rows).all()
+        else:
+            db.execute(insert(_sweets), rows)
+            created = db.execute(
+                select(_sweets.c.id, _sweets.c.name).where(_sweets.c.name.in_([sweet.name for sweet in new]))
+            ).all()
+        search.index_sweets(db, created)
+
+    _touch(db, *existing.values(), *(row.id for row in created))
+    db.commit()
+    return len(new), len(existing)
@@ -1,17 +1,205 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-import os
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateColumn
+from starlette.concurrency import run_in_threadpool
+import threading
+import time
+from ..config import settings
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dev.db")
+DATABASE_URL = settings.database_url
+# ASYNC_DB=1 serves requests from an AsyncEngine: a request waiting on the
+# database then holds no threadpool thread. The sync engine is always created
+# for schema management, startup seeding and scripts.
+ASYNC_DB = settings.async_db
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+
+class PoolWaitStats:
+    """How long callers waited to check a connection out of the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            if seconds > self.max_wait:
+                self.max_wait = seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "total_wait_seconds": round(self.total_wait, 6),
+                "avg_wait_seconds": round(self.total_wait / self.checkouts, 6) if self.checkouts else 0.0,
+                "max_wait_seconds": round(self.max_wait, 6),
+            }
+
+
+pool_wait_stats = PoolWaitStats()
+
+
+class _TimedCheckout:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait_stats.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":"))
+
+
+def engine_options(url: str, poolclass=TimedQueuePool) -> dict:
+    options = {}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    if not _is_memory_sqlite(url):
+        options.update(
+            poolclass=poolclass,
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+    return options
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers run alongside the writer; busy_timeout makes writers wait
+    instead of failing. Foreign keys are enforced as they are on PostgreSQL.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA cache_size={-int(settings.sqlite_cache_size_kib)}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
-def get_db():
+# Indexes older versions created that now hurt query plans, by table.
+RETIRED_INDEXES = {
+    "stock_ledger": ("ix_stock_ledger_sweet_id",),
+}
+
+
+@event.listens_for(Base.metadata, "after_create")
+def upgrade_existing_tables(target, connection, **kw):
+    """
+    create_all() only creates missing tables. Add the columns (which must be
+    nullable or have a server default) and indexes that were added to existing
+    models since, and drop RETIRED_INDEXES, so databases created by older
+    versions keep working.
+    """
+    inspector = inspect(connection)
+    for table in target.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        table_name = connection.dialect.identifier_preparer.format_table(table)
+        for column in table.columns:
+            if column.name not in existing:
+                spec = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {spec}"))
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection, checkfirst=True)
+        for name in RETIRED_INDEXES.get(table.name, ()):
+            if name in indexes:
+                connection.execute(text(f"DROP INDEX {connection.dialect.identifier_preparer.quote(name)}"))
+
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+
+def async_url(url: str) -> str:
+    """Map a sync DATABASE_URL onto its asyncio driver."""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DB:
+    async_engine = create_async_engine(
+        async_url(DATABASE_URL), **engine_options(DATABASE_URL, poolclass=TimedAsyncAdaptedQueuePool)
+    )
+    if DATABASE_URL.startswith("sqlite"):
+        event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+    # Responses are serialized after the session work is done, outside the
+    # greenlet bridge, so loaded objects must not expire on commit.
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+get_db = get_async_db if ASYNC_DB else get_sync_db
+
+
+async def run_db(db, fn, *args, **kwargs):
+    """
+    Await a sync CRUD function, fn(session, *args, **kwargs), with either
+    session flavour. AsyncSession runs it through run_sync on the event loop
+    (greenlet bridge, no thread); a sync Session runs it in the threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def pool_status() -> dict:
+    """Current connection pool occupancy and checkout wait times, for sizing workers."""
+    active = async_engine if async_engine is not None else engine
+    pool = active.pool
+    status = {"pool": pool.__class__.__name__, "checkout_wait": pool_wait_stats.snapshot()}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            checked_in=pool.checkedin(),
+        )
+    return status
@@ -0,0 +1,111 @@
+"""
+Password hashing off the request threads.
+
+PBKDF2 is deliberately CPU-bound, so hashes are computed in a small dedicated
+process pool. At most PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE jobs may be
+in flight; beyond that HashPoolBusy is raised immediately instead of queueing,
+so a login storm cannot starve the rest of the API. If a worker dies (say it
+is OOM-killed) the executor is marked broken; it is then replaced and the job
+retried once on the fresh pool.
+
+This module must stay importable without the rest of the app (only config),
+because spawned pool workers import it on their own.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import threading
+from anyio import to_thread
+from passlib.context import CryptContext
+from .config import settings
+
+HASH_ROUNDS = settings.password_hash_rounds
+HASH_WORKERS = settings.password_hash_workers
+HASH_QUEUE = settings.password_hash_queue
+
+# Use pbkdf2_sha256 to avoid system-native bcrypt dependency issues.
+# min_rounds makes hashes below the configured cost report needs_update,
+# so raising PASSWORD_HASH_ROUNDS upgrades users as they log in.
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__rounds=HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=HASH_ROUNDS,
+)
+
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing pool already has its maximum number of jobs."""
+
+
+class HashPoolUnavailable(HashPoolBusy):
+    """Raised when a freshly started hashing pool breaks as well."""
+
+
+_slots = threading.BoundedSemaphore(max(1, HASH_WORKERS + HASH_QUEUE))
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _discard(pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next _executor() call starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Return (valid, new_hash); new_hash is set when the stored hash is below the current cost."""
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+async def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashPoolBusy()
+    try:
+        if HASH_WORKERS <= 0:
+            # Pool disabled: still keep hashing off the event loop.
+            return await to_thread.run_sync(fn, *args)
+        for attempt in range(2):
+            pool = _executor()
+            try:
+                return await asyncio.wrap_future(pool.submit(fn, *args))
+            except BrokenProcessPool:
+                _discard(pool)
+        raise HashPoolUnavailable()
+    finally:
+        _slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_and_update_async(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await _run(verify_and_update, password, hashed_password)
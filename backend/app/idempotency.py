@@ -0,0 +1,123 @@
+"""
+Idempotency keys for purchase and checkout requests.
+
+A client sends an Idempotency-Key header; the first request with a key runs
+normally and its response body is stored in idempotency_keys *in the same
+transaction* as its stock changes (a before_commit listener inserts the row,
+using the result crud leaves in session.info["commit_result"]). A retry with
+the same key therefore either finds the stored response and replays it, or
+finds nothing because the first attempt never committed. Two concurrent
+requests with one key race on the primary key: the loser's transaction,
+stock changes included, fails with IntegrityError and it replays the
+winner's response.
+
+Keys are scoped per user and kept for IDEMPOTENCY_TTL seconds; recent results
+are also held in an in-memory front cache. Reusing a key for a different
+request (method, path or body) is rejected.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+import hashlib
+import itertools
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models
+from .cache import TTLCache
+from .config import settings
+from .db.session import Base
+
+MAX_KEY_LENGTH = 255
+PURGE_EVERY = 1000
+
+PENDING = "idempotency_pending"
+STORED = "idempotency_stored"
+COMMIT_RESULT = "commit_result"
+
+Stored = namedtuple("Stored", ["fingerprint", "status_code", "body"])
+
+_keys = models.IdempotencyKey.__table__
+_calls = itertools.count(1)
+
+front_cache = TTLCache(
+    maxsize=settings.idempotency_cache_size,
+    ttl=min(settings.idempotency_cache_ttl, settings.idempotency_ttl),
+)
+
+
+def fingerprint(method: str, path: str, body: bytes) -> str:
+    digest = hashlib.sha256(f"{method} {path}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def lookup(db: Session, user_id: int, key: str) -> Stored | None:
+    """The stored response for (user, key), or None if there is none or it expired."""
+    stored = front_cache.get((user_id, key))
+    if stored is not None:
+        return stored
+    row = db.execute(
+        select(_keys.c.fingerprint, _keys.c.status_code, _keys.c.body)
+        .where(_keys.c.user_id == user_id, _keys.c.key == key, _keys.c.expires_at > datetime.utcnow())
+    ).first()
+    if row is None:
+        return None
+    stored = Stored(row.fingerprint, row.status_code, row.body.encode())
+    front_cache.set((user_id, key), stored)
+    return stored
+
+
+def execute(db: Session, user_id: int, key: str, fingerprint: str, encode, call):
+    """
+    Run call(db), a crud write returning (result, error), recording the key
+    with its transaction; encode(result) gives the JSON body to store.
+    Returns (Stored, None) on success, or call's (result, error) on failure.
+    """
+    now = datetime.utcnow()
+    # An expired row for this key would block the insert; clear it (and, now
+    # and then, every expired row) in the same transaction.
+    expired = _keys.c.expires_at <= now
+    if next(_calls) % PURGE_EVERY:
+        expired = expired & (_keys.c.user_id == user_id) & (_keys.c.key == key)
+    db.execute(delete(_keys).where(expired))
+
+    db.info[PENDING] = (user_id, key, fingerprint, encode)
+    try:
+        result, error = call(db)
+    except IntegrityError:
+        db.rollback()
+        stored = lookup(db, user_id, key)
+        if stored is None:
+            raise
+        return stored, None
+    finally:
+        db.info.pop(PENDING, None)
+    if error:
+        return result, error
+    stored = db.info.pop(STORED)
+    front_cache.set((user_id, key), stored)
+    return stored, None
+
+
+@event.listens_for(Session, "before_commit")
+def _record_key(session):
+    result = session.info.pop(COMMIT_RESULT, None)
+    pending = session.info.pop(PENDING, None)
+    if pending is None or result is None:
+        return
+    user_id, key, fingerprint, encode = pending
+    body = encode(result)
+    session.execute(insert(_keys).values(
+        user_id=user_id,
+        key=key,
+        fingerprint=fingerprint,
+        status_code=200,
+        body=body.decode(),
+        expires_at=datetime.utcnow() + timedelta(seconds=settings.idempotency_ttl),
+    ))
+    session.info[STORED] = Stored(fingerprint, 200, body)
+
+
+@event.listens_for(Base.metadata, "after_drop")
+def _clear_front_cache(*args, **kwargs):
+    front_cache.clear()
@@ -0,0 +1,115 @@
+"""
+Bulk sweet import from CSV or NDJSON.
+
+Rows are validated with schemas.SweetCreate and matched on name in chunks
+of CHUNK_SIZE, one transaction per chunk (see crud.import_sweets). Invalid
+rows are skipped and reported by row number; a chunk that fails to write is
+reported row by row and the import carries on with the next chunk.
+
+Used by POST /api/sweets/import and from the command line:
+
+    python -m app.importer supplier.csv [--format csv|ndjson] [--chunk-size 1000]
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from . import crud, schemas
+
+CHUNK_SIZE = 1000
+FORMATS = ("csv", "ndjson")
+
+
+def guess_format(filename: str | None) -> str:
+    return "ndjson" if filename and filename.lower().endswith((".ndjson", ".jsonl")) else "csv"
+
+
+def read_records(stream, format: str):
+    """Yield (row number, record or parse error message) from a binary stream."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        for number, record in enumerate(csv.DictReader(text), start=1):
+            yield number, record
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield number, f"invalid JSON: {exc}"
+            continue
+        yield number, record if isinstance(record, dict) else "expected a JSON object"
+
+
+def _validation_messages(exc: ValidationError) -> list[str]:
+    return [f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()]
+
+
+def import_sweets(db: Session, records, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Validate and write (row number, record) pairs; returns an import report."""
+    report = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+
+    def fail(number: int, errors: list[str]):
+        report["failed"] += 1
+        report["errors"].append({"row": number, "errors": errors})
+
+    def flush(chunk: list[tuple[int, schemas.SweetCreate]]):
+        try:
+            inserted, updated = crud.import_sweets(db, [sweet for _, sweet in chunk])
+        except SQLAlchemyError as exc:
+            db.rollback()
+            for number, _ in chunk:
+                fail(number, [f"database error: {exc.__class__.__name__}"])
+            return
+        report["inserted"] += inserted
+        report["updated"] += updated
+
+    chunk = []
+    for number, record in records:
+        if isinstance(record, str):
+            fail(number, [record])
+            continue
+        try:
+            chunk.append((number, schemas.SweetCreate.model_validate(record)))
+        except ValidationError as exc:
+            fail(number, _validation_messages(exc))
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    return report
+
+
+def main(argv=None):
+    from .db.session import Base, SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Bulk import sweets from CSV or NDJSON.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        with open(args.path, "rb") as stream:
+            records = read_records(stream, args.format or guess_format(args.path))
+            report = import_sweets(db, records, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
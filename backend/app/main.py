@@ -1,15 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from datetime import datetime
+from functools import partial
+from typing import Literal
+import asyncio
+import logging
+from fastapi import FastAPI, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from .db.session import engine, Base, get_db, SessionLocal
-from . import models, schemas, crud, auth
+from starlette.concurrency import run_in_threadpool
+from .db.session import engine, Base, get_db, run_db, pool_status, SessionLocal
+from . import models, schemas, crud, analytics, auth, catalog, export, hashing, idempotency, importer, metrics, pagination, profiling, responses, stream
+from .config import settings
 from .seed import seed_sweets
 from fastapi.middleware.cors import CORSMiddleware
 
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Sweet Shop API")
+logger = logging.getLogger(__name__)
 
 
 @app.on_event("startup")
@@ -19,7 +29,51 @@ def startup_seed():
         seed_sweets(db)
     finally:
         db.close()
-        
+
+
+@app.on_event("shutdown")
+def shutdown_hashing_pool():
+    hashing.shutdown()
+
+
+def _drain(job, batch: int):
+    """Run job(db, limit=batch) until it handles less than a full batch."""
+    db = SessionLocal()
+    try:
+        while job(db, limit=batch) == batch:
+            pass
+    finally:
+        db.close()
+
+
+async def _run_periodically(interval: float, job, batch: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(_drain, job, batch)
+        except Exception:
+            logger.exception("Background job %s failed", job.__name__)
+
+
+@app.on_event("startup")
+async def start_background_jobs():
+    # Also folds deltas left by an earlier ledger-mode run, since counter-mode
+    # stock checks only look at sweets.quantity.
+    await run_in_threadpool(_drain, crud.compact_ledger, settings.ledger_compact_batch)
+    jobs = []
+    if settings.inventory_mode == "ledger":
+        jobs.append((settings.ledger_compact_interval, crud.compact_ledger, settings.ledger_compact_batch))
+    if settings.rollup_refresh_interval > 0:
+        jobs.append((settings.rollup_refresh_interval, analytics.refresh_rollups, settings.rollup_refresh_batch))
+    app.state.background_jobs = [asyncio.create_task(_run_periodically(*job)) for job in jobs]
+
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for task in getattr(app.state, "background_jobs", []):
+        task.cancel()
+
+
 origins = [
     "http://localhost:5173",
     "http://localhost:3000",
@@ -32,115 +86,346 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed", "Server-Timing"],
 )
+if settings.server_timing_enabled:
+    app.add_middleware(profiling.QueryTimingMiddleware)
+if settings.metrics_enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint; disabled (404) with METRICS_ENABLED=false."""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.exception_handler(pagination.InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: pagination.InvalidCursor):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+SortKey = Literal["id", "name", "price"]
+SearchSortKey = Literal["id", "name", "price", "relevance"]
+# Validated here so every backend (database, catalog cache) pages the same way:
+# SQLite reads LIMIT -1 as "no limit", a list slice as "all but the last".
+MAX_PAGE_SIZE = 1000
+Skip = Query(0, ge=0)
+PageLimit = Query(100, ge=1, le=MAX_PAGE_SIZE)
+
+
+def _not_modified(request: Request, response: Response, resource: str) -> Response | None:
+    """
+    Tag the response with the catalog ETag, or return a 304 if the client's
+    If-None-Match already matches it; either way no query has run yet.
+    """
+    tag = catalog.etag(resource)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+        if tag in candidates or "*" in candidates:
+            return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "no-cache"
+    return None
+
+
+def _rows_response(response: Response, rows, model) -> responses.RowsResponse:
+    """Encode plain rows directly, keeping the headers already set on response."""
+    return responses.RowsResponse(rows, model, headers=dict(response.headers))
+
+
+IdempotencyKey = Header(None, alias="Idempotency-Key", min_length=1, max_length=idempotency.MAX_KEY_LENGTH)
+
+
+async def _run_idempotent(request: Request, db, user: models.User, key: str | None, response_type, fn, **kwargs):
+    """
+    Run a crud write, fn(db, **kwargs) -> (result, error). With an
+    Idempotency-Key the JSON response is stored with the write and replayed
+    on retries, so a successful result comes back as a ready Response.
+    """
+    if key is None:
+        return await run_db(db, fn, **kwargs)
+    fingerprint = idempotency.fingerprint(request.method, request.url.path, await request.body())
+    stored = await run_db(db, idempotency.lookup, user_id=user.id, key=key)
+    replayed = stored is not None
+    if not replayed:
+        adapter = TypeAdapter(response_type)
+        stored, error = await run_db(
+            db, idempotency.execute,
+            user_id=user.id, key=key, fingerprint=fingerprint,
+            encode=lambda result: adapter.dump_json(adapter.validate_python(result, from_attributes=True)),
+            call=partial(fn, **kwargs),
+        )
+        if error:
+            return stored, error
+    if stored.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return Response(
+        content=stored.body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true" if replayed else "false"},
+    ), None
+
+
+def _set_next_cursor(response: Response, rows, sort: str, limit: int):
+    cursor = pagination.next_cursor(rows, sort, limit)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+
 
 # Authentication Routes
+#
+# Password hashing runs in the dedicated process pool (see hashing.py), so
+# these handlers never hold a threadpool thread while a hash is computed.
 @app.post("/api/auth/register", response_model=schemas.UserOut)
-def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = crud.get_user_by_username(db, username=user_in.username)
+async def register(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
+    existing = await run_db(db, crud.get_user_by_username, username=user_in.username)
     if existing:
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Mark users with "admin" in username as admin
     is_admin = "admin" in user_in.username.lower()
+    hashed_password = await auth.get_password_hash_async(user_in.password)
     
     try:
-        user = crud.create_user(db, user=user_in, is_admin=is_admin)
+        user = await run_db(db, crud.create_user, user=user_in, is_admin=is_admin, hashed_password=hashed_password)
         return user
     except IntegrityError:
         # Handle race condition: concurrent registration with same username
         # Database constraint prevents duplication; rollback and return proper error
-        db.rollback()
+        await run_db(db, Session.rollback)
         raise HTTPException(status_code=400, detail="Username already registered")
 
 
 @app.post("/api/auth/login", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_db(db, crud.get_user_by_username, username=form_data.username)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    valid, new_hash = await auth.verify_password_async(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
+    if new_hash:
+        await run_db(db, crud.update_user_password_hash, user.id, new_hash)
     access_token = auth.create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 # Product Routes
 @app.post("/api/products", response_model=schemas.ProductOut)
-def create_product(product_in: schemas.ProductCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return crud.create_product(db, product=product_in)
+async def create_product(product_in: schemas.ProductCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return await run_db(db, crud.create_product, product=product_in)
 
 
 @app.get("/api/products", response_model=list[schemas.ProductOut])
-def get_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.list_products(db, skip=skip, limit=limit)
+async def get_products(
+    request: Request,
+    response: Response,
+    skip: int = Skip,
+    limit: int = PageLimit,
+    cursor: str = None,
+    sort: SortKey = "id",
+    db: Session = Depends(get_db)
+):
+    not_modified = _not_modified(request, response, "products")
+    if not_modified:
+        return not_modified
+    products = await run_db(db, crud.list_products, skip=skip, limit=limit, cursor=cursor, sort=sort)
+    _set_next_cursor(response, products, sort, limit)
+    return _rows_response(response, products, schemas.ProductOut)
 
 
 # Sweet Routes
 @app.post("/api/sweets", response_model=schemas.SweetResponse)
-def create_sweet(sweet_in: schemas.SweetCreate, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin)):
+async def create_sweet(sweet_in: schemas.SweetCreate, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin)):
     """Create a new sweet. Requires admin authorization."""
-    return crud.create_sweet(db, sweet=sweet_in)
+    return await run_db(db, crud.create_sweet, sweet=sweet_in)
 
 
 @app.get("/api/sweets", response_model=list[schemas.SweetResponse])
-def list_sweets(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """List all sweets with pagination."""
-    return crud.list_sweets(db, skip=skip, limit=limit)
+async def list_sweets(
+    request: Request,
+    response: Response,
+    skip: int = Skip,
+    limit: int = PageLimit,
+    cursor: str = None,
+    sort: SortKey = "id",
+    db: Session = Depends(get_db)
+):
+    """List all sweets. Page with the X-Next-Cursor header value, or skip/limit."""
+    not_modified = _not_modified(request, response, "sweets")
+    if not_modified:
+        return not_modified
+    sweets = await run_db(db, catalog.list_sweets, skip=skip, limit=limit, cursor=cursor, sort=sort)
+    _set_next_cursor(response, sweets, sort, limit)
+    return _rows_response(response, sweets, schemas.SweetResponse)
+
+
+@app.get("/api/sweets/stream")
+async def stream_sweets():
+    """
+    Server-Sent Events feed of stock changes: a "stock" event carrying
+    [{id, price, quantity}] (or {id, deleted: true}) after each committed write.
+    Load GET /api/sweets once after connecting, and again after a reconnect.
+    """
+    queue = stream.stock_feed.subscribe()
+    return StreamingResponse(
+        stream.events(queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Declared before PUT /api/sweets/{sweet_id} so "prices" is not read as an id.
+@app.put("/api/sweets/prices", response_model=list[schemas.SweetResponse])
+async def update_sweet_prices(
+    prices_in: schemas.PriceBatchRequest,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Update many sweet prices in one transaction; all or nothing. Requires admin authorization."""
+    lines = [(item.sweet_id, item.price) for item in prices_in.items]
+    result, error = await run_db(db, crud.update_sweet_prices, lines=lines)
+    if error == "not_found":
+        raise HTTPException(status_code=404, detail={"message": "Sweet not found", "sweet_ids": result})
+    return result
 
 
 @app.put("/api/sweets/{sweet_id}", response_model=schemas.SweetResponse)
-def update_sweet_price(
+async def update_sweet_price(
     sweet_id: int,
     sweet_in: schemas.SweetUpdatePrice,
     db: Session = Depends(get_db),
     current_admin: models.User = Depends(auth.get_current_admin)
 ):
     """Update sweet price. Requires admin authorization."""
-    sweet, error = crud.update_sweet_price(db=db, sweet_id=sweet_id, price=sweet_in.price)
+    sweet, error = await run_db(db, crud.update_sweet_price, sweet_id=sweet_id, price=sweet_in.price)
     if error == "not_found":
         raise HTTPException(status_code=404, detail="Sweet not found")
     return sweet
 
 
 @app.delete("/api/sweets/{sweet_id}")
-def delete_sweet(
+async def delete_sweet(
     sweet_id: int,
     db: Session = Depends(get_db),
     current_admin: models.User = Depends(auth.get_current_admin)
 ):
     """Delete a sweet. Requires admin authorization."""
-    deleted, error = crud.delete_sweet(db=db, sweet_id=sweet_id)
+    deleted, error = await run_db(db, crud.delete_sweet, sweet_id=sweet_id)
     if error == "not_found":
         raise HTTPException(status_code=404, detail="Sweet not found")
     return {"detail": "Sweet deleted"}
 
 
 @app.get("/api/sweets/search", response_model=list[schemas.SweetResponse])
-def search_sweets(
+async def search_sweets(
+    request: Request,
+    response: Response,
     name: str = None,
     category: str = None,
     min_price: float = None,
     max_price: float = None,
-    skip: int = 0,
-    limit: int = 100,
+    skip: int = Skip,
+    limit: int = PageLimit,
+    cursor: str = None,
+    sort: SearchSortKey = None,
     db: Session = Depends(get_db)
 ):
-    """Search sweets by name, category, and/or price range."""
-    return crud.search_sweets(
+    """Search sweets by name, category, and/or price range. Name matches are ranked by relevance by default."""
+    if sort is None:
+        sort = "relevance" if name else "id"
+    not_modified = _not_modified(request, response, "sweets")
+    if not_modified:
+        return not_modified
+    sweets = await run_db(
         db,
+        catalog.search_sweets,
         name=name,
         category=category,
         min_price=min_price,
         max_price=max_price,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor,
+        sort=sort
+    )
+    _set_next_cursor(response, sweets, sort, limit)
+    return _rows_response(response, sweets, schemas.SweetResponse)
+
+
+@app.get("/api/sweets/export")
+async def export_sweets(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Stream the whole catalog as NDJSON or CSV in id order. Requires admin authorization."""
+    return StreamingResponse(
+        export.export_sweets(format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="sweets.{format}"'},
     )
 
 
+@app.post("/api/sweets/import", response_model=schemas.ImportReport)
+async def import_sweets(
+    file: UploadFile = File(...),
+    format: Literal["csv", "ndjson"] = None,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """
+    Bulk insert or update sweets (matched by name) from a CSV or NDJSON upload.
+    Invalid rows are skipped and listed in the report. Requires admin authorization.
+    """
+    records = importer.read_records(file.file, format or importer.guess_format(file.filename))
+    return await run_db(db, importer.import_sweets, records=records)
+
+
 # Inventory Routes
+@app.post("/api/sweets/purchase", response_model=list[schemas.SweetResponse])
+async def purchase_sweets(
+    request: Request,
+    purchase_in: schemas.PurchaseRequest,
+    idempotency_key: str = IdempotencyKey,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Purchase several sweets at once; either every line succeeds or none do.
+    Retries with the same Idempotency-Key replay the first response. Requires authentication.
+    """
+    lines = [(item.sweet_id, item.quantity) for item in purchase_in.items]
+    result, error = await _run_idempotent(
+        request, db, current_user, idempotency_key, list[schemas.SweetResponse], crud.purchase_sweets, lines=lines
+    )
+    metrics.record_purchase("bulk", error)
+    if error == "not_found":
+        raise HTTPException(status_code=404, detail={"message": "Sweet not found", "sweet_ids": result})
+    elif error == "out_of_stock":
+        raise HTTPException(status_code=400, detail={"message": "Out of stock", "shortages": result})
+    return result
+
+
 @app.post("/api/sweets/{sweet_id}/purchase", response_model=schemas.SweetResponse)
-def purchase_sweet(sweet_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    """Purchase a sweet by decreasing its quantity by 1. Requires authentication."""
-    sweet, error = crud.purchase_sweet(db=db, sweet_id=sweet_id)
+async def purchase_sweet(
+    request: Request,
+    sweet_id: int,
+    idempotency_key: str = IdempotencyKey,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Purchase a sweet by decreasing its quantity by 1.
+    Retries with the same Idempotency-Key replay the first response. Requires authentication.
+    """
+    sweet, error = await _run_idempotent(
+        request, db, current_user, idempotency_key, schemas.SweetResponse, crud.purchase_sweet, sweet_id=sweet_id
+    )
+    metrics.record_purchase("single", error)
     if error == "not_found":
         raise HTTPException(status_code=404, detail="Sweet not found")
     elif error == "out_of_stock":
@@ -148,15 +433,164 @@ def purchase_sweet(sweet_id: int, db: Session = Depends(get_db), current_user: m
     return sweet
 
 
+@app.post("/api/sweets/restock", response_model=list[schemas.SweetResponse])
+async def restock_sweets(
+    restock_in: schemas.RestockBatchRequest,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Restock many sweets in one transaction; all or nothing. Requires admin authorization."""
+    lines = [(item.sweet_id, item.quantity) for item in restock_in.items]
+    result, error = await run_db(db, crud.restock_sweets, lines=lines)
+    if error == "not_found":
+        raise HTTPException(status_code=404, detail={"message": "Sweet not found", "sweet_ids": result})
+    return result
+
+
 @app.post("/api/sweets/{sweet_id}/restock", response_model=schemas.SweetResponse)
-def restock_sweet(
+async def restock_sweet(
     sweet_id: int,
     restock_in: schemas.RestockRequest,
     db: Session = Depends(get_db),
     current_admin: models.User = Depends(auth.get_current_admin)
 ):
     """Restock a sweet. Requires admin authorization."""
-    sweet, error = crud.restock_sweet(db=db, sweet_id=sweet_id, quantity=restock_in.quantity)
+    sweet, error = await run_db(db, crud.restock_sweet, sweet_id=sweet_id, quantity=restock_in.quantity)
+    if error == "not_found":
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    return sweet
+
+
+@app.put("/api/sweets/{sweet_id}/stock-buckets", response_model=schemas.SweetResponse)
+async def shard_sweet_stock(
+    sweet_id: int,
+    sharding_in: schemas.StockShardingRequest,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Split a hot sweet's stock across N buckets (0 turns sharding off). Requires admin authorization."""
+    sweet, error = await run_db(db, crud.shard_sweet_stock, sweet_id=sweet_id, buckets=sharding_in.buckets)
+    if error == "not_found":
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    elif error == "ledger_mode":
+        raise HTTPException(status_code=409, detail="Stock buckets are not used in ledger inventory mode")
+    return sweet
+
+
+@app.put("/api/sweets/{sweet_id}/reorder-threshold", response_model=schemas.LowStockSweet)
+async def set_reorder_threshold(
+    sweet_id: int,
+    threshold_in: schemas.ReorderThresholdUpdate,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Set the stock level at which a sweet is reported as low (null clears it). Requires admin authorization."""
+    sweet, error = await run_db(db, crud.set_reorder_threshold, sweet_id=sweet_id, threshold=threshold_in.reorder_threshold)
     if error == "not_found":
         raise HTTPException(status_code=404, detail="Sweet not found")
     return sweet
+
+
+@app.get("/api/sweets/{sweet_id}/ledger", response_model=list[schemas.LedgerEntryOut])
+async def get_sweet_ledger(
+    sweet_id: int,
+    limit: int = PageLimit,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Most recent stock changes recorded in ledger inventory mode, newest first. Requires admin authorization."""
+    return await run_db(db, crud.list_ledger, sweet_id=sweet_id, limit=limit)
+
+
+# Order Routes
+@app.post("/api/orders", response_model=schemas.OrderOut)
+async def create_order(
+    request: Request,
+    order_in: schemas.OrderCreate,
+    idempotency_key: str = IdempotencyKey,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Check out an order, taking stock for every line in one transaction.
+    Retries with the same Idempotency-Key replay the first response. Requires authentication.
+    """
+    lines = [(item.sweet_id, item.quantity) for item in order_in.items]
+    result, error = await _run_idempotent(
+        request, db, current_user, idempotency_key, schemas.OrderOut, crud.create_order,
+        user_id=current_user.id, lines=lines
+    )
+    metrics.record_purchase("order", error)
+    if error == "not_found":
+        raise HTTPException(status_code=404, detail={"message": "Sweet not found", "sweet_ids": result})
+    elif error == "out_of_stock":
+        raise HTTPException(status_code=400, detail={"message": "Out of stock", "shortages": result})
+    return result
+
+
+@app.get("/api/orders/{order_id}", response_model=schemas.OrderOut)
+async def get_order(order_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    """Get an order. Only its owner and admins can see it."""
+    order = await run_db(db, crud.get_order, order_id=order_id)
+    if order is None or (order["user_id"] != current_user.id and not current_user.is_admin):
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+
+# Admin Routes
+@app.get("/api/admin/db-pool")
+async def get_db_pool_status(current_admin: models.User = Depends(auth.get_current_admin)):
+    """Connection pool occupancy and checkout wait times. Requires admin authorization."""
+    return pool_status()
+
+
+@app.get("/api/admin/low-stock", response_model=list[schemas.LowStockSweet])
+async def get_low_stock(limit: int = PageLimit, db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin)):
+    """Sweets at or below their reorder threshold, most urgent first. Requires admin authorization."""
+    return await run_db(db, crud.list_low_stock, limit=limit)
+
+
+@app.get("/api/admin/catalog-cache")
+async def get_catalog_cache_stats(current_admin: models.User = Depends(auth.get_current_admin)):
+    """Catalog cache version, size and hit/miss counts. Requires admin authorization."""
+    return catalog.catalog_cache.stats()
+
+
+@app.post("/api/admin/analytics/refresh")
+async def refresh_sales_rollups(db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin)):
+    """Fold new order items into the sales rollups now instead of waiting for the background job."""
+    refreshed = 0
+    while True:
+        count = await run_db(db, analytics.refresh_rollups, limit=settings.rollup_refresh_batch)
+        refreshed += count
+        if count < settings.rollup_refresh_batch:
+            return {"refreshed_items": refreshed}
+
+
+@app.get("/api/admin/analytics/sweets", response_model=list[schemas.SweetSales])
+async def get_sales_by_sweet(
+    sort: Literal["revenue", "units"] = "revenue",
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Best-selling sweets from the sales rollups. Requires admin authorization."""
+    return await run_db(db, analytics.sales_by_sweet, sort=sort, limit=limit)
+
+
+@app.get("/api/admin/analytics/categories", response_model=list[schemas.CategorySales])
+async def get_sales_by_category(db: Session = Depends(get_db), current_admin: models.User = Depends(auth.get_current_admin)):
+    """Units and revenue per category from the sales rollups. Requires admin authorization."""
+    return await run_db(db, analytics.sales_by_category)
+
+
+@app.get("/api/admin/analytics/timeseries", response_model=list[schemas.SalesPoint])
+async def get_sales_over_time(
+    granularity: Literal["hour", "day"] = "hour",
+    start: datetime = None,
+    end: datetime = None,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth.get_current_admin)
+):
+    """Units and revenue per hour or day from the sales rollups. Requires admin authorization."""
+    return await run_db(db, analytics.sales_over_time, granularity=granularity, start=start, end=end)
@@ -0,0 +1,187 @@
+"""
+Prometheus metrics served at GET /metrics (text exposition format 0.0.4).
+
+MetricsMiddleware is a plain ASGI middleware, so it adds no per-request
+objects beyond a wrapped send(). Requests are labelled with their route
+template (/api/sweets/{sweet_id}, not the raw path) so the number of series
+stays fixed; requests that match no route share the "unmatched" label.
+Server-Sent Events streams are counted once when they start but are left out
+of the in-flight gauge and the latency histogram, since they stay open for
+as long as the client listens.
+
+Every update happens on the event loop thread (the middleware, and routes
+after their database work returns), so the counters are plain dicts and
+ints with no locks. Connection pool figures are read when /metrics is
+scraped.
+"""
+from bisect import bisect_left
+import time
+from .db.session import pool_status
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED = "unmatched"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield self.name, _labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket", _labels(self.labels, labels, le), cumulative
+            yield f"{self.name}_sum", _labels(self.labels, labels), total
+            yield f"{self.name}_count", _labels(self.labels, labels), cumulative
+
+
+requests_total = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route, until the response body is sent.", ("method", "route")
+)
+requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+request_errors = Counter("http_request_errors_total", "HTTP responses with a 4xx or 5xx status.", ("status",))
+purchases = Counter(
+    "sweet_purchases_total",
+    "Purchase and checkout requests by outcome (ok, out_of_stock, not_found).",
+    ("kind", "outcome"),
+)
+
+REGISTRY = (requests_total, request_duration, requests_in_flight, request_errors, purchases)
+
+
+def record_purchase(kind: str, error: str | None):
+    purchases.inc((kind, error or "ok"))
+
+
+def _pool_metrics() -> list[str]:
+    status = pool_status()
+    lines = []
+    for key, name, help in (
+        ("checked_out", "db_pool_checked_out", "Connections currently checked out of the pool."),
+        ("overflow", "db_pool_overflow", "Connections open beyond the pool size (negative while the pool is not full)."),
+        ("size", "db_pool_size", "Configured pool size."),
+    ):
+        if key in status:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {status[key]}"]
+    waits = status["checkout_wait"]
+    lines += [
+        "# HELP db_pool_checkouts_total Connections checked out of the pool.",
+        "# TYPE db_pool_checkouts_total counter",
+        f"db_pool_checkouts_total {waits['checkouts']}",
+        "# HELP db_pool_checkout_wait_seconds_total Time spent waiting for a pooled connection.",
+        "# TYPE db_pool_checkout_wait_seconds_total counter",
+        f"db_pool_checkout_wait_seconds_total {_number(float(waits['total_wait_seconds']))}",
+    ]
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+        lines += [f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples()]
+    lines += _pool_metrics()
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.values.clear()
+
+
+def _is_event_stream(message) -> bool:
+    return any(
+        name == b"content-type" and value.startswith(b"text/event-stream")
+        for name, value in message.get("headers", ())
+    )
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # if the app raises before starting a response
+        streaming = False
+        start = time.perf_counter()
+        requests_in_flight.inc()
+
+        def labels():
+            return scope["method"], getattr(scope.get("route"), "path", UNMATCHED)
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if _is_event_stream(message):
+                    streaming = True
+                    requests_in_flight.dec()
+                    requests_total.inc(labels() + (status,))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not streaming:
+                elapsed = time.perf_counter() - start
+                requests_in_flight.dec()
+                request_duration.observe(labels(), elapsed)
+                requests_total.inc(labels() + (status,))
+                if status >= 400:
+                    request_errors.inc((status,))
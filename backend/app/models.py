@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, Date, DateTime, Boolean, Index, false, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .db.session import Base
@@ -20,6 +20,12 @@ class Product(Base):
     description = Column(Text, nullable=True)
     price = Column(Float, nullable=False, default=0.0)
 
+    # (sort key, id) indexes back keyset pagination, see pagination.py
+    __table_args__ = (
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_price_id", "price", "id"),
+    )
+
 
 class Sweet(Base):
     __tablename__ = "sweets"
@@ -28,6 +34,61 @@ class Sweet(Base):
     category = Column(String, index=True, nullable=False)
     price = Column(Float, nullable=False)
     quantity = Column(Integer, nullable=False, default=0)
+    # Restock alert level; NULL means the sweet is never reported as low on stock.
+    reorder_threshold = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_sweets_name_id", "name", "id"),
+        Index("ix_sweets_price_id", "price", "id"),
+        # Only sweets at or below their threshold are indexed, so the low-stock
+        # query reads a handful of entries however large the catalog is. The
+        # purchase UPDATE maintains it in the same transaction.
+        Index(
+            "ix_sweets_low_stock", "id",
+            postgresql_where=text("quantity <= reorder_threshold"),
+            sqlite_where=text("quantity <= reorder_threshold"),
+        ),
+    )
+
+
+class SweetStockBucket(Base):
+    """
+    One sub-counter of a sweet in sharded stock mode. While a sweet has
+    buckets, its stock lives here and sweets.quantity is kept at 0.
+    """
+    __tablename__ = "sweet_stock_buckets"
+    sweet_id = Column(Integer, ForeignKey("sweets.id"), primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+
+
+class StockLedgerEntry(Base):
+    """
+    One stock change in ledger inventory mode (INVENTORY_MODE=ledger).
+    Current stock is sweets.quantity plus the deltas not yet compacted; the
+    compactor folds deltas into sweets.quantity and keeps the rows as history.
+    """
+    __tablename__ = "stock_ledger"
+    id = Column(Integer, primary_key=True)
+    # NULL once the sweet is deleted; its history is kept.
+    sweet_id = Column(Integer, ForeignKey("sweets.id", ondelete="SET NULL"), nullable=True)
+    delta = Column(Integer, nullable=False)
+    reason = Column(String(16), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    compacted = Column(Boolean, nullable=False, default=False)
+
+    # Every stock read sums a sweet's pending deltas, so no index may offer a
+    # path through its compacted history: a plain sweet_id index would, and
+    # the planner can prefer it over the partial one. History lookups use
+    # (sweet_id, compacted, id), which seeks straight to the pending rows too.
+    __table_args__ = (
+        Index("ix_stock_ledger_sweet_history", "sweet_id", "compacted", "id"),
+        Index(
+            "ix_stock_ledger_pending", "sweet_id", "id",
+            postgresql_where=text("compacted = false"),
+            sqlite_where=text("compacted = 0"),
+        ),
+    )
 
 
 class Order(Base):
@@ -42,7 +103,63 @@ class Order(Base):
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
+    sweet_id = Column(Integer, ForeignKey("sweets.id", ondelete="SET NULL"), nullable=True)
     quantity = Column(Integer, nullable=False, default=1)
+    # Price at checkout; later price changes don't rewrite past orders.
+    unit_price = Column(Float, nullable=True)
+    # Set once the item has been added to the sales rollups (see analytics.py).
+    rolled_up = Column(Boolean, nullable=False, default=False, server_default=false())
     order = relationship("Order", back_populates="items")
+
+    __table_args__ = (
+        Index(
+            "ix_order_items_pending_rollup", "id",
+            postgresql_where=text("rolled_up = false"),
+            sqlite_where=text("rolled_up = 0"),
+        ),
+    )
+
+
+# Sales rollups, maintained incrementally from order_items by analytics.py.
+class SalesBySweet(Base):
+    __tablename__ = "sales_by_sweet"
+    sweet_id = Column(Integer, primary_key=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class SalesByCategory(Base):
+    __tablename__ = "sales_by_category"
+    category = Column(String, primary_key=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class SalesHourly(Base):
+    __tablename__ = "sales_hourly"
+    hour = Column(DateTime, primary_key=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class SalesDaily(Base):
+    __tablename__ = "sales_daily"
+    day = Column(Date, primary_key=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class IdempotencyKey(Base):
+    """
+    Stored response of a request sent with an Idempotency-Key header,
+    replayed when the same user retries with the same key (see idempotency.py).
+    """
+    __tablename__ = "idempotency_keys"
+    user_id = Column(Integer, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False, default=200)
+    body = Column(Text, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,56 @@
+"""
+Keyset (cursor) pagination.
+
+A cursor is an opaque url-safe token holding the sort key and id of the last
+row of a page. The next page is "rows after (value, id) in (sort, id) order",
+which an index on (sort column, id) answers with a range scan, so every page
+costs the same as the first and rows edited between pages are neither skipped
+nor repeated.
+"""
+import base64
+import json
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    raw = json.dumps([sort, value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, sort: str):
+    """Return (value, id) from a cursor produced for the same sort order."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if cursor_sort != sort or not isinstance(row_id, int):
+        raise InvalidCursor("Cursor does not match sort order")
+    return value, row_id
+
+
+def paginate(query, sort_column, id_column, sort: str, cursor: str | None, skip: int, limit: int):
+    """Apply stable (sort, id) ordering, the cursor position, then skip/limit."""
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort)
+        if sort_column is id_column:
+            query = query.filter(id_column > row_id)
+        else:
+            query = query.filter(tuple_(sort_column, id_column) > tuple_(value, row_id))
+    if sort_column is id_column:
+        query = query.order_by(id_column)
+    else:
+        query = query.order_by(sort_column, id_column)
+    return query.offset(skip).limit(limit)
+
+
+def next_cursor(rows, sort: str, limit: int) -> str | None:
+    """Cursor for the page after rows, or None when rows is the last page."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(sort, getattr(last, sort), last.id)
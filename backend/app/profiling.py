@@ -0,0 +1,122 @@
+"""
+Per-request SQL statistics.
+
+Engine-level cursor events time every statement any engine runs (the async
+engine included, through its sync_engine). While a request is being served
+the timings are added to a QueryStats held in a context variable, which
+follows the request into run_in_threadpool workers and AsyncSession
+greenlets. QueryTimingMiddleware reports each request's totals in a
+Server-Timing header that browser dev tools display, for example
+
+    Server-Timing: db;desc="3 queries";dur=1.840, db-slowest;dur=0.912
+
+Two things are logged on the "app.sql" logger, whether or not a request is
+active:
+- any statement slower than SLOW_QUERY_MS;
+- a request that runs one statement REPEATED_QUERY_WARN times or more,
+  which is usually an N+1 pattern (a lazy load or a lookup inside a loop).
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+
+logger = logging.getLogger("app.sql")
+
+LOGGED_STATEMENT_LENGTH = 500
+_STARTED = "query_started"
+
+
+class QueryStats:
+    __slots__ = ("count", "total", "slowest", "slowest_statement", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.statements[statement] += 1
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return f'db;desc="{self.count} queries";dur={self.total * 1000:.3f}, db-slowest;dur={self.slowest * 1000:.3f}'
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        return [(statement, times) for statement, times in self.statements.most_common() if times >= threshold]
+
+
+_current: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def _shorten(statement: str) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= LOGGED_STATEMENT_LENGTH else statement[:LOGGED_STATEMENT_LENGTH] + "..."
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_STARTED, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info[_STARTED].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    if elapsed * 1000 >= settings.slow_query_ms:
+        # Parameters are left out: they can carry user data.
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, _shorten(statement))
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_failed(context):
+    if context.connection is not None and context.connection.info.get(_STARTED):
+        context.connection.info[_STARTED].pop()
+
+
+@contextmanager
+def track_queries():
+    """Collect the statements run inside the block (in this context) into a QueryStats."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class QueryTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send_wrapper)
+        for statement, times in stats.repeated(settings.repeated_query_warn):
+            logger.warning(
+                "%s %s ran the same statement %d times (possible N+1): %s",
+                scope["method"], scope["path"], times, _shorten(statement),
+            )
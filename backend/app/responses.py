@@ -0,0 +1,39 @@
+"""
+Fast JSON encoding for read-only list endpoints.
+
+List endpoints select plain rows (see crud.SWEET_COLUMNS / PRODUCT_COLUMNS),
+and those rows already have the types the response schema declares, so
+re-validating every row through Pydantic only burns CPU and allocations.
+RowsResponse picks the schema's fields off each row and encodes the list in
+one call, with orjson when it is installed and the stdlib json otherwise.
+The route keeps its response_model, so the OpenAPI schema is unchanged.
+"""
+import json
+from operator import attrgetter
+from fastapi import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def encode_rows(rows, model: type[BaseModel]) -> bytes:
+    """Encode rows as a JSON array of objects with exactly model's fields."""
+    fields = tuple(model.model_fields)
+    values = attrgetter(*fields)
+    return dumps([dict(zip(fields, values(row))) for row in rows])
+
+
+class RowsResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, rows, model: type[BaseModel], **kwargs):
+        super().__init__(content=encode_rows(rows, model), **kwargs)
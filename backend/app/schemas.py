@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 
 class UserCreate(BaseModel):
@@ -49,6 +49,37 @@ class RestockRequest(BaseModel):
     quantity: int = Field(..., ge=0)
 
 
+class PurchaseLine(BaseModel):
+    sweet_id: int
+    quantity: int = Field(1, ge=1)
+
+
+class PurchaseRequest(BaseModel):
+    items: List[PurchaseLine] = Field(..., min_length=1)
+
+
+class RestockLine(BaseModel):
+    sweet_id: int
+    quantity: int = Field(..., ge=0)
+
+
+class RestockBatchRequest(BaseModel):
+    items: List[RestockLine] = Field(..., min_length=1)
+
+
+class PriceLine(BaseModel):
+    sweet_id: int
+    price: float = Field(..., gt=0.0)
+
+
+class PriceBatchRequest(BaseModel):
+    items: List[PriceLine] = Field(..., min_length=1)
+
+
+class StockShardingRequest(BaseModel):
+    buckets: int = Field(..., ge=0, le=64)
+
+
 class SweetUpdatePrice(BaseModel):
     price: float = Field(..., gt=0.0)
 
@@ -63,18 +94,82 @@ class SweetResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class LedgerEntryOut(BaseModel):
+    id: int
+    delta: int
+    reason: str
+    created_at: datetime
+    compacted: bool
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ImportRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class ImportReport(BaseModel):
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[ImportRowError]
+
+
+class ReorderThresholdUpdate(BaseModel):
+    reorder_threshold: Optional[int] = Field(..., ge=0)
+
+
+class LowStockSweet(SweetResponse):
+    reorder_threshold: Optional[int]
+
+
 class OrderItemBase(BaseModel):
-    product_id: int
-    quantity: int = 1
+    sweet_id: int
+    quantity: int = Field(1, ge=1)
 
 
 class OrderCreate(BaseModel):
-    items: List[OrderItemBase]
+    items: List[OrderItemBase] = Field(..., min_length=1)
+
+
+class OrderItemOut(OrderItemBase):
+    sweet_id: Optional[int]  # None once the sweet has been deleted
+    unit_price: float
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 class OrderOut(BaseModel):
     id: int
     user_id: int
     created_at: datetime
+    items: List[OrderItemOut] = []
+    total: float = 0.0
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SweetSales(BaseModel):
+    sweet_id: int
+    name: Optional[str]
+    units: int
+    revenue: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class CategorySales(BaseModel):
+    category: str
+    units: int
+    revenue: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SalesPoint(BaseModel):
+    period: datetime | date
+    units: int
+    revenue: float
 
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,313 @@
+"""
+Indexed full-text search over sweet names.
+
+Three backends share one interface, chosen per database dialect:
+
+- SQLite: an FTS5 table (sweets_fts, rowid = sweet id) ranked with bm25
+- PostgreSQL: a GIN expression index on to_tsvector('simple', name), ranked with ts_rank
+- anything else, or SEARCH_BACKEND=memory: an in-process inverted index
+
+Queries are tokenized into words and every word must match as a prefix, so
+"gul jam" finds "Gulab Jamun". match() returns the filtered query plus a rank
+expression where lower is more relevant. crud keeps the index in sync when
+sweets are created or deleted (price updates don't touch the name).
+
+The in-process index is per worker. Its changes are applied after the
+transaction commits (and dropped if it rolls back), and the whole index is
+reloaded after SEARCH_INDEX_TTL seconds, which bounds how long sweets
+created or deleted through another worker process are missed.
+"""
+from bisect import bisect_left, insort
+import re
+import sqlite3
+import threading
+import time
+from sqlalchemy import case, event, false, func, literal_column, null, select, text, Index
+from sqlalchemy.dialects import postgresql  # noqa: F401 - registers to_tsvector/to_tsquery typing
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import column, table
+from . import models
+from .config import settings
+from .db.session import Base
+
+# session.info key: (sweet_id, name or None to remove) changes awaiting commit
+PENDING_CHANGES = "search_changes"
+
+
+def tokenize(value: str) -> list[str]:
+    return re.findall(r"\w+", value.lower())
+
+
+class SqliteFtsBackend:
+    fts = table("sweets_fts", column("rowid"), column("rank"))
+
+    def create(self, connection):
+        connection.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS sweets_fts USING fts5(name)"))
+        # Backfill rows that predate the index (existing databases).
+        connection.execute(text(
+            "INSERT INTO sweets_fts(rowid, name) SELECT id, name FROM sweets "
+            "WHERE id NOT IN (SELECT rowid FROM sweets_fts)"
+        ))
+
+    def drop(self, connection):
+        connection.execute(text("DROP TABLE IF EXISTS sweets_fts"))
+
+    def index(self, db, sweet_id: int, name: str):
+        db.execute(text("DELETE FROM sweets_fts WHERE rowid = :id"), {"id": sweet_id})
+        db.execute(text("INSERT INTO sweets_fts(rowid, name) VALUES (:id, :name)"), {"id": sweet_id, "name": name})
+
+    def index_many(self, db, rows):
+        params = [{"id": sweet_id, "name": name} for sweet_id, name in rows]
+        db.execute(text("DELETE FROM sweets_fts WHERE rowid = :id"), params)
+        db.execute(text("INSERT INTO sweets_fts(rowid, name) VALUES (:id, :name)"), params)
+
+    def remove(self, db, sweet_id: int):
+        db.execute(text("DELETE FROM sweets_fts WHERE rowid = :id"), {"id": sweet_id})
+
+    def match(self, db, query, value: str):
+        tokens = tokenize(value)
+        if not tokens:
+            return query.filter(false()), null()
+        expression = " ".join(f'"{token}"*' for token in tokens)
+        query = query.join(self.fts, self.fts.c.rowid == models.Sweet.id).filter(
+            literal_column("sweets_fts").op("MATCH")(expression)
+        )
+        return query, self.fts.c.rank
+
+
+class PostgresBackend:
+    config = text("'simple'")
+
+    def create(self, connection):
+        pass  # the GIN index below is part of the sweets table DDL
+
+    def drop(self, connection):
+        pass
+
+    def index(self, db, sweet_id: int, name: str):
+        pass  # expression index is maintained by PostgreSQL
+
+    def index_many(self, db, rows):
+        pass
+
+    def remove(self, db, sweet_id: int):
+        pass
+
+    def match(self, db, query, value: str):
+        tokens = tokenize(value)
+        if not tokens:
+            return query.filter(false()), null()
+        vector = func.to_tsvector(self.config, models.Sweet.name)
+        tsquery = func.to_tsquery(self.config, " & ".join(f"{token}:*" for token in tokens))
+        return query.filter(vector.op("@@")(tsquery)), -func.ts_rank(vector, tsquery)
+
+
+Index(
+    "ix_sweets_name_tsv",
+    func.to_tsvector(PostgresBackend.config, models.Sweet.__table__.c.name),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+
+
+class InvertedIndex:
+    """Token -> sweet ids postings plus a sorted vocabulary for prefix lookups."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: dict[str, set[int]] = {}
+        self._docs: dict[int, list[str]] = {}
+        self._vocabulary: list[str] = []
+        self.loaded = False
+
+    def load(self, rows):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._vocabulary.clear()
+            for sweet_id, name in rows:
+                self._add(sweet_id, name)
+            self.loaded = True
+
+    def reset(self):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._vocabulary.clear()
+            self.loaded = False
+
+    def add(self, sweet_id: int, name: str):
+        with self._lock:
+            self._remove(sweet_id)
+            self._add(sweet_id, name)
+
+    def remove(self, sweet_id: int):
+        with self._lock:
+            self._remove(sweet_id)
+
+    def _add(self, sweet_id: int, name: str):
+        tokens = tokenize(name)
+        self._docs[sweet_id] = tokens
+        for token in tokens:
+            if token not in self._postings:
+                self._postings[token] = set()
+                insort(self._vocabulary, token)
+            self._postings[token].add(sweet_id)
+
+    def _remove(self, sweet_id: int):
+        for token in self._docs.pop(sweet_id, ()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(sweet_id)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def search(self, value: str) -> dict[int, float]:
+        """Score every sweet matching all query tokens as prefixes; exact words score higher."""
+        scores: dict[int, float] | None = None
+        with self._lock:
+            for token in tokenize(value):
+                token_scores: dict[int, float] = {}
+                start = bisect_left(self._vocabulary, token)
+                for word in self._vocabulary[start:]:
+                    if not word.startswith(token):
+                        break
+                    weight = 2.0 if word == token else 1.0
+                    for sweet_id in self._postings[word]:
+                        token_scores[sweet_id] = max(token_scores.get(sweet_id, 0.0), weight)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {k: v + token_scores[k] for k, v in scores.items() if k in token_scores}
+                if not scores:
+                    return {}
+        return scores or {}
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.inverted = InvertedIndex()
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        # One list per reload in progress: changes committed while it reads the table.
+        self._replays: list[list[tuple]] = []
+
+    def create(self, connection):
+        pass
+
+    def drop(self, connection):
+        self.inverted.reset()
+
+    def _ensure_loaded(self, db):
+        now = time.monotonic()
+        with self._lock:
+            if self.inverted.loaded and now - self._loaded_at < settings.search_index_ttl:
+                return
+            replay = []
+            self._replays.append(replay)
+        try:
+            rows = db.execute(select(models.Sweet.id, models.Sweet.name)).all()
+            with self._lock:
+                self.inverted.load(rows)
+                self._apply(replay)
+                self._loaded_at = now
+        finally:
+            with self._lock:
+                self._replays.remove(replay)
+
+    def _pending(self, db) -> list:
+        return db.info.setdefault(PENDING_CHANGES, [])
+
+    def index(self, db, sweet_id: int, name: str):
+        self._pending(db).append((sweet_id, name))
+
+    def index_many(self, db, rows):
+        self._pending(db).extend(rows)
+
+    def remove(self, db, sweet_id: int):
+        self._pending(db).append((sweet_id, None))
+
+    def commit(self, changes: list[tuple]):
+        with self._lock:
+            for replay in self._replays:
+                replay.extend(changes)
+            if self.inverted.loaded:
+                self._apply(changes)
+
+    def _apply(self, changes):
+        for sweet_id, name in changes:
+            if name is None:
+                self.inverted.remove(sweet_id)
+            else:
+                self.inverted.add(sweet_id, name)
+
+    def match(self, db, query, value: str):
+        self._ensure_loaded(db)
+        scores = self.inverted.search(value)
+        if not scores:
+            return query.filter(false()), null()
+        rank = case({sweet_id: -score for sweet_id, score in scores.items()}, value=models.Sweet.id, else_=0.0)
+        return query.filter(models.Sweet.id.in_(list(scores))), rank
+
+
+def _fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE probe USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+_sqlite_backend = SqliteFtsBackend() if _fts5_available() else None
+_postgres_backend = PostgresBackend()
+_memory_backend = MemoryBackend()
+
+
+def backend_for(dialect):
+    if settings.search_backend != "memory":
+        if dialect.name == "sqlite" and _sqlite_backend is not None:
+            return _sqlite_backend
+        if dialect.name == "postgresql":
+            return _postgres_backend
+    return _memory_backend
+
+
+def index_sweet(db, sweet_id: int, name: str):
+    backend_for(db.get_bind().dialect).index(db, sweet_id, name)
+
+
+def index_sweets(db, rows):
+    """Index many (sweet_id, name) pairs at once."""
+    if rows:
+        backend_for(db.get_bind().dialect).index_many(db, rows)
+
+
+def remove_sweet(db, sweet_id: int):
+    backend_for(db.get_bind().dialect).remove(db, sweet_id)
+
+
+def match(db, query, value: str):
+    return backend_for(db.get_bind().dialect).match(db, query, value)
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_search_index(target, connection, **kw):
+    backend_for(connection.dialect).create(connection)
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def _drop_search_index(target, connection, **kw):
+    backend_for(connection.dialect).drop(connection)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    changes = session.info.pop(PENDING_CHANGES, None)
+    if changes:
+        _memory_backend.commit(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_CHANGES, None)
@@ -1,6 +1,6 @@
 import os
 from sqlalchemy.orm import Session
-from app import models
+from app import models, search
 
 INITIAL_SWEETS = [
     {"name": "Gulab Jamun", "category": "Indian Sweet", "price": 120, "quantity": 25},
@@ -23,7 +23,9 @@ def seed_sweets(db: Session):
     if existing_count > 0:
         return
 
-    for sweet in INITIAL_SWEETS:
-        db.add(models.Sweet(**sweet))
-
+    sweets = [models.Sweet(**sweet) for sweet in INITIAL_SWEETS]
+    db.add_all(sweets)
+    db.flush()
+    # The search index is kept up to date by crud; rows added here need indexing too.
+    search.index_sweets(db, [(sweet.id, sweet.name) for sweet in sweets])
     db.commit()
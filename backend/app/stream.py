@@ -0,0 +1,147 @@
+"""
+Live stock feed behind GET /api/sweets/stream (Server-Sent Events).
+
+Open storefront and admin tabs subscribe once instead of polling
+/api/sweets, so read load follows the number of changes rather than the
+number of viewers. Writes already record the sweets they touched in
+session.info["changed_sweets"]; the catalog's after_commit listener hands
+those ids to stock_feed.notify. One task per process re-reads the changed
+rows (after the commit, so a message never carries data older than the
+change that triggered it; bursts of changes are coalesced into one query)
+and fans a compact message out to every subscriber:
+
+    event: stock
+    data: [{"id": 1, "price": 2.5, "quantity": 9}, {"id": 4, "deleted": true}]
+
+Each subscriber has a queue of at most STREAM_CLIENT_BUFFER messages. A
+client that falls that far behind is disconnected rather than buffered
+without limit; EventSource reconnects on its own and should reload the list.
+With no subscribers a commit costs one attribute check.
+
+The feed is per process: with several workers a client only sees changes
+made by the worker it is connected to.
+"""
+import asyncio
+import contextvars
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+from . import crud, models
+from .config import settings
+from .db.session import SessionLocal
+from .responses import dumps
+
+FETCH_LIMIT = 1000
+RETRY_MS = 3000
+
+_CLOSED = object()
+
+
+class StockFeed:
+    def __init__(self, buffer: int):
+        self.buffer = buffer
+        self.dropped = 0
+        self._subscribers: set[asyncio.Queue] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._dirty: set[int] = set()
+        self._wake: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a client; must be called on the event loop serving it."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._wake, self._dirty = loop, asyncio.Event(), set()
+            self._task = None
+        if self._task is None or self._task.done():
+            # Not the subscribing request's context: the publisher outlives it, and
+            # per-request state (such as profiling's query stats) must not follow it.
+            self._task = loop.create_task(self._publish_changes(), context=contextvars.Context())
+        queue = asyncio.Queue(maxsize=self.buffer)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self._subscribers), "dropped": self.dropped}
+
+    def notify(self, sweet_ids):
+        """Called after a commit, from any thread, with the ids of the sweets it changed."""
+        loop = self._loop
+        if not self._subscribers or loop is None or loop.is_closed():
+            return
+        ids = set(sweet_ids)
+        try:
+            loop.call_soon_threadsafe(self._mark, ids)
+        except RuntimeError:  # loop shut down between the check and the call
+            pass
+
+    def _mark(self, ids: set[int]):
+        self._dirty.update(ids)
+        self._wake.set()
+
+    async def _publish_changes(self):
+        while self._subscribers:
+            await self._wake.wait()
+            self._wake.clear()
+            dirty, self._dirty = sorted(self._dirty), set()
+            for start in range(0, len(dirty), FETCH_LIMIT):
+                ids = dirty[start:start + FETCH_LIMIT]
+                rows = await run_in_threadpool(_fetch, ids)
+                self.broadcast(_changes(ids, rows))
+
+    def broadcast(self, changes: list[dict]):
+        message = f"event: stock\ndata: {dumps(changes).decode()}\n\n"
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(queue)
+
+    def _drop(self, queue: asyncio.Queue):
+        self.dropped += 1
+        self._subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(_CLOSED)
+
+
+def _fetch(ids: list[int]):
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(models.Sweet.id, models.Sweet.price, crud.SWEET_COLUMNS[-1]).where(models.Sweet.id.in_(ids))
+        ).all()
+    finally:
+        db.close()
+
+
+def _changes(ids: list[int], rows) -> list[dict]:
+    found = {row.id: row for row in rows}
+    return [
+        {"id": sweet_id, "price": found[sweet_id].price, "quantity": found[sweet_id].quantity}
+        if sweet_id in found else {"id": sweet_id, "deleted": True}
+        for sweet_id in ids
+    ]
+
+
+stock_feed = StockFeed(buffer=settings.stream_client_buffer)
+
+
+async def events(queue: asyncio.Queue, heartbeat: float | None = None):
+    """The SSE body for one subscriber; keeps idle connections alive with comment lines."""
+    heartbeat = settings.stream_heartbeat_interval if heartbeat is None else heartbeat
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if message is _CLOSED:
+                return
+            yield message
+    finally:
+        stock_feed.unsubscribe(queue)
@@ -0,0 +1,192 @@
+"""
+Admin operations tests - covers admin-only operational endpoints.
+"""
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import text
+from app.main import app
+from app.db.session import Base, engine
+
+client = TestClient(app)
+
+
+def setup_module(module):
+    """Reset database before running admin tests."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def _get_auth_token(username: str, password: str) -> str:
+    """Helper to register a user and return JWT token."""
+    client.post(
+        "/api/auth/register",
+        json={
+            "username": username,
+            "password": password,
+            "full_name": f"{username.capitalize()} User"
+        }
+    )
+    response = client.post(
+        "/api/auth/login",
+        data={"username": username, "password": password}
+    )
+    return response.json()["access_token"]
+
+
+class TestDatabasePool:
+    """Tests for pool tuning and visibility (GET /api/admin/db-pool)."""
+
+    def test_pool_status_requires_admin(self):
+        token = _get_auth_token("pool_user", "secret123")
+        response = client.get("/api/admin/db-pool", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 403
+
+    def test_pool_status_reports_checkout_waits(self):
+        token = _get_auth_token("pool_admin", "secret123")
+        response = client.get("/api/admin/db-pool", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["checkout_wait"]["checkouts"] > 0
+        assert "checked_out" in data
+
+    def test_sqlite_pragmas_applied(self):
+        if engine.dialect.name != "sqlite":
+            pytest.skip("SQLite-only pragmas")
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+
+class TestMetrics:
+    """Tests for the Prometheus endpoint (GET /metrics)."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        from app import metrics
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        metrics.reset()
+        yield
+
+    def _scrape(self) -> dict:
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        samples = {}
+        for line in response.text.splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_requests_are_labelled_by_route(self):
+        token = _get_auth_token("metrics_admin", "secret123")
+        headers = {"Authorization": f"Bearer {token}"}
+        client.get("/api/sweets/1", headers=headers)
+        client.get("/api/sweets/2", headers=headers)
+        client.get("/no-such-path")
+        samples = self._scrape()
+        route = 'method="GET",route="/api/sweets/{sweet_id}"'
+        assert samples['http_request_duration_seconds_count{' + route + '}'] == 2
+        assert samples['http_request_duration_seconds_bucket{' + route + ',le="+Inf"}'] == 2
+        assert samples['http_requests_total{method="GET",route="unmatched",status="404"}'] == 1
+        assert samples['http_request_errors_total{status="404"}'] >= 1
+        # the scrape itself is in flight while the page is rendered
+        assert samples["http_requests_in_flight"] == 1
+        assert "db_pool_checkouts_total" in samples
+
+    def test_event_streams_are_not_in_flight(self):
+        """An SSE response is counted once, but neither held in flight nor timed."""
+        import asyncio
+        from app import metrics
+        seen = {}
+
+        async def sse_app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"text/event-stream")]})
+            seen["in_flight"] = metrics.requests_in_flight.values.get((), 0)
+            await send({"type": "http.response.body", "body": b": keepalive\n\n"})
+
+        async def ignore(message):
+            pass
+
+        scope = {"type": "http", "method": "GET", "path": "/events"}
+        asyncio.run(metrics.MetricsMiddleware(sse_app)(scope, None, ignore))
+        assert seen["in_flight"] == 0
+        assert metrics.requests_in_flight.values.get((), 0) == 0
+        assert metrics.requests_total.values == {("GET", metrics.UNMATCHED, 200): 1}
+        assert metrics.request_duration.values == {}
+
+    def test_purchase_outcomes_are_counted(self):
+        token = _get_auth_token("metrics_buyer_admin", "secret123")
+        headers = {"Authorization": f"Bearer {token}"}
+        sweet = client.post(
+            "/api/sweets", json={"name": "Soan Papdi", "category": "flaky", "price": 3.0, "quantity": 1}, headers=headers
+        ).json()
+        client.post(f"/api/sweets/{sweet['id']}/purchase", headers=headers)
+        client.post(f"/api/sweets/{sweet['id']}/purchase", headers=headers)
+        client.post(
+            "/api/sweets/purchase", json={"items": [{"sweet_id": sweet["id"], "quantity": 1}]}, headers=headers
+        )
+        samples = self._scrape()
+        assert samples['sweet_purchases_total{kind="single",outcome="ok"}'] == 1
+        assert samples['sweet_purchases_total{kind="single",outcome="out_of_stock"}'] == 1
+        assert samples['sweet_purchases_total{kind="bulk",outcome="out_of_stock"}'] == 1
+
+
+def _assert_max_queries(response, limit: int):
+    """Fail when the request behind response ran more than limit SQL statements (from its Server-Timing header)."""
+    import re
+    match = re.search(r'db;desc="(\d+) queries"', response.headers.get("server-timing", ""))
+    assert match, "response has no Server-Timing db entry"
+    count = int(match.group(1))
+    assert count <= limit, f"{response.request.method} {response.request.url.path} ran {count} queries (max {limit})"
+    return count
+
+
+class TestQueryStats:
+    """Per-request SQL statistics: Server-Timing header, slow and repeated statement logs."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("query_admin", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.sweet = client.post(
+            "/api/sweets", json={"name": "Mysore Pak", "category": "ghee", "price": 6.0, "quantity": 20},
+            headers=self.headers
+        ).json()
+        yield
+
+    def test_endpoint_query_budgets(self):
+        """Hot endpoints stay within a fixed number of statements, however much data there is."""
+        sweet_id = self.sweet["id"]
+        _assert_max_queries(client.get("/api/sweets"), 1)
+        _assert_max_queries(client.post(f"/api/sweets/{sweet_id}/purchase", headers=self.headers), 2)
+        _assert_max_queries(client.post(
+            "/api/sweets/purchase", json={"items": [{"sweet_id": sweet_id, "quantity": 2}]}, headers=self.headers
+        ), 2)
+        order = client.post(
+            "/api/orders",
+            json={"items": [{"sweet_id": sweet_id, "quantity": 1}, {"sweet_id": sweet_id, "quantity": 1}]},
+            headers=self.headers
+        )
+        _assert_max_queries(order, 4)
+        _assert_max_queries(client.get(f"/api/orders/{order.json()['id']}", headers=self.headers), 2)
+
+    def test_server_timing_reports_db_time(self):
+        response = client.get("/api/sweets/search", params={"name": "Mysore"})
+        timing = response.headers["server-timing"]
+        assert timing.startswith('db;desc="1 queries";dur=')
+        assert "db-slowest;dur=" in timing
+
+    def test_slow_and_repeated_statements_are_logged(self, monkeypatch, caplog):
+        from app.config import settings
+        monkeypatch.setattr(settings, "slow_query_ms", 0.0)
+        monkeypatch.setattr(settings, "repeated_query_warn", 1)
+        with caplog.at_level("WARNING", logger="app.sql"):
+            client.get("/api/sweets", params={"limit": 7})
+        messages = [record.getMessage() for record in caplog.records]
+        assert any(message.startswith("Slow query (") and "FROM sweets" in message for message in messages)
+        assert any("GET /api/sweets ran the same statement 1 times" in message for message in messages)
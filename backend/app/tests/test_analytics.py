@@ -0,0 +1,119 @@
+"""
+Sales rollup and analytics endpoint tests (/api/admin/analytics/*).
+"""
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+import pytest
+from app.main import app
+from app.db.session import Base, engine
+
+client = TestClient(app)
+
+
+def _get_auth_token(username: str, password: str) -> str:
+    """Helper to register a user and return JWT token."""
+    client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "full_name": f"{username.capitalize()} User"}
+    )
+    response = client.post("/api/auth/login", data={"username": username, "password": password})
+    return response.json()["access_token"]
+
+
+class TestSalesRollups:
+    """Orders are folded into rollup tables that the analytics endpoints read."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.headers = {"Authorization": f"Bearer {_get_auth_token('admin_analytics', 'secret123')}"}
+        self.ladoo = self._create_sweet("Ladoo", "festive", 2.0)
+        self.barfi = self._create_sweet("Barfi", "milk", 5.0)
+        self.peda = self._create_sweet("Peda", "milk", 1.0)
+        yield
+
+    def _create_sweet(self, name: str, category: str, price: float) -> dict:
+        return client.post(
+            "/api/sweets",
+            json={"name": name, "category": category, "price": price, "quantity": 100},
+            headers=self.headers
+        ).json()
+
+    def _order(self, *lines):
+        response = client.post(
+            "/api/orders",
+            json={"items": [{"sweet_id": sweet["id"], "quantity": quantity} for sweet, quantity in lines]},
+            headers=self.headers
+        )
+        assert response.status_code == 200
+
+    def _refresh(self) -> int:
+        response = client.post("/api/admin/analytics/refresh", headers=self.headers)
+        assert response.status_code == 200
+        return response.json()["refreshed_items"]
+
+    def test_rollups_follow_orders_incrementally(self):
+        self._order((self.ladoo, 3), (self.barfi, 1))
+        assert self._refresh() == 2
+        self._order((self.barfi, 2), (self.peda, 4))
+        assert self._refresh() == 2
+        assert self._refresh() == 0
+
+        sweets = client.get("/api/admin/analytics/sweets", headers=self.headers).json()
+        assert [(s["name"], s["units"], s["revenue"]) for s in sweets] == [
+            ("Barfi", 3, 15.0), ("Ladoo", 3, 6.0), ("Peda", 4, 4.0)
+        ]
+        by_units = client.get("/api/admin/analytics/sweets", params={"sort": "units", "limit": 1}, headers=self.headers)
+        assert [s["name"] for s in by_units.json()] == ["Peda"]
+
+        categories = client.get("/api/admin/analytics/categories", headers=self.headers).json()
+        assert categories == [
+            {"category": "milk", "units": 7, "revenue": 19.0},
+            {"category": "festive", "units": 3, "revenue": 6.0},
+        ]
+
+    def test_time_series(self):
+        self._order((self.ladoo, 1))
+        self._order((self.barfi, 2))
+        self._refresh()
+        hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+        hourly = client.get("/api/admin/analytics/timeseries", headers=self.headers).json()
+        assert hourly == [{"period": hour.isoformat(), "units": 3, "revenue": 12.0}]
+        daily = client.get("/api/admin/analytics/timeseries", params={"granularity": "day"}, headers=self.headers).json()
+        assert daily == [{"period": hour.date().isoformat(), "units": 3, "revenue": 12.0}]
+
+        past = client.get(
+            "/api/admin/analytics/timeseries",
+            params={"end": (hour - timedelta(hours=1)).isoformat()},
+            headers=self.headers
+        )
+        assert past.json() == []
+
+    def test_concurrent_refreshes_count_each_item_once(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from app import analytics
+        from app.db.session import SessionLocal
+        for _ in range(10):
+            self._order((self.ladoo, 1))
+
+        def refresh(_):
+            db = SessionLocal()
+            try:
+                return analytics.refresh_rollups(db, limit=3)
+            except Exception:
+                db.rollback()
+                return 0
+            finally:
+                db.close()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(refresh, range(4)))
+        self._refresh()
+        assert client.get("/api/admin/analytics/sweets", headers=self.headers).json()[0]["units"] == 10
+
+    def test_analytics_require_admin(self):
+        headers = {"Authorization": f"Bearer {_get_auth_token('analytics_user', 'secret123')}"}
+        assert client.get("/api/admin/analytics/sweets", headers=headers).status_code == 403
+        assert client.post("/api/admin/analytics/refresh", headers=headers).status_code == 403
@@ -3,8 +3,15 @@ Authentication tests - covers user registration and login.
 Tests are isolated and do not test product/domain logic.
 """
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from passlib.hash import pbkdf2_sha256
+import threading
+import pytest
 from app.main import app
-from app.db.session import Base, engine
+from app import hashing
+from app.auth import principal_cache
+from app.db.session import Base, engine, SessionLocal
+from app import models
 
 client = TestClient(app)
 
@@ -120,3 +127,126 @@ class TestLogin:
         )
         assert response.status_code == 401
         assert "Incorrect username or password" in response.json()["detail"]
+
+
+class TestPrincipalCache:
+    """Authenticated requests should resolve the user from the principal cache."""
+
+    def _token(self, username: str) -> str:
+        client.post(
+            "/api/auth/register",
+            json={"username": username, "password": "secret123", "full_name": "Cache User"}
+        )
+        response = client.post("/api/auth/login", data={"username": username, "password": "secret123"})
+        return response.json()["access_token"]
+
+    def test_repeat_requests_skip_user_lookup(self):
+        """Only the first authenticated request should query the users table."""
+        token = self._token("erin")
+        user_queries = []
+
+        def count_user_queries(conn, cursor, statement, parameters, context, executemany):
+            if "FROM users" in statement:
+                user_queries.append(statement)
+
+        event.listen(engine, "before_cursor_execute", count_user_queries)
+        try:
+            for _ in range(3):
+                response = client.post(
+                    "/api/products",
+                    json={"name": "Box", "description": None, "price": 1.0},
+                    headers={"Authorization": f"Bearer {token}"}
+                )
+                assert response.status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", count_user_queries)
+
+        assert len(user_queries) <= 1
+
+    def test_registration_invalidates_cached_principal(self):
+        """Creating a user must evict any cached principal with that username."""
+        principal_cache.set("frank", "stale")
+        self._token("frank")
+        assert principal_cache.get("frank") != "stale"
+
+    def test_dropping_tables_clears_cache(self):
+        principal_cache.set("gina", "stale")
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        assert principal_cache.get("gina") is None
+
+
+class TestPasswordHashingPool:
+    """Hashing runs in a bounded pool with back-pressure and rehash-on-login."""
+
+    def test_login_rehashes_below_current_cost(self):
+        """A hash with fewer rounds than configured is upgraded on login."""
+        client.post(
+            "/api/auth/register",
+            json={"username": "harry", "password": "secret123", "full_name": "Harry Hill"}
+        )
+        db = SessionLocal()
+        try:
+            user = db.query(models.User).filter(models.User.username == "harry").first()
+            user.hashed_password = pbkdf2_sha256.using(rounds=1000).hash("secret123")
+            db.commit()
+        finally:
+            db.close()
+
+        response = client.post("/api/auth/login", data={"username": "harry", "password": "secret123"})
+        assert response.status_code == 200
+
+        db = SessionLocal()
+        try:
+            user = db.query(models.User).filter(models.User.username == "harry").first()
+            assert not hashing.pwd_context.needs_update(user.hashed_password)
+        finally:
+            db.close()
+
+    def test_login_returns_503_when_pool_saturated(self, monkeypatch):
+        monkeypatch.setattr(hashing, "_slots", threading.BoundedSemaphore(1))
+        hashing._slots.acquire()
+        try:
+            response = client.post("/api/auth/login", data={"username": "harry", "password": "secret123"})
+        finally:
+            hashing._slots.release()
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_login_survives_a_killed_worker(self):
+        """A dead hashing worker breaks the pool; the next login runs on a replacement pool."""
+        import os
+        import signal
+        if hashing.HASH_WORKERS <= 0 or not hasattr(signal, "SIGKILL"):
+            pytest.skip("needs the process pool and POSIX signals")
+        client.post(
+            "/api/auth/register",
+            json={"username": "ivy", "password": "secret123", "full_name": "Ivy Ives"}
+        )
+        assert client.post("/api/auth/login", data={"username": "ivy", "password": "secret123"}).status_code == 200
+        pool = hashing._executor()
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join(5)
+
+        response = client.post("/api/auth/login", data={"username": "ivy", "password": "secret123"})
+        assert response.status_code == 200
+        assert hashing._executor() is not pool
+
+    def test_returns_503_when_pool_keeps_breaking(self, monkeypatch):
+        from concurrent.futures.process import BrokenProcessPool
+
+        class BrokenPool:
+            def submit(self, *args):
+                raise BrokenProcessPool("worker died")
+
+            def shutdown(self, **kwargs):
+                pass
+
+        monkeypatch.setattr(hashing, "HASH_WORKERS", 1)
+        monkeypatch.setattr(hashing, "_executor", BrokenPool)
+        response = client.post(
+            "/api/auth/register",
+            json={"username": "jack", "password": "secret123", "full_name": "Jack Jones"}
+        )
+        assert response.status_code == 503
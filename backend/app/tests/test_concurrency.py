@@ -0,0 +1,231 @@
+"""
+Concurrency stress tests for purchases and restocks.
+
+Several threads, each with its own session, purchase and restock the same
+sweets at once through crud, in every inventory mode (single counter,
+sharded buckets, ledger with the compactor running alongside). Demand is
+higher than supply, so the stock checks are exercised at zero. The final
+quantities must match the committed purchases and restocks exactly: no
+oversell and no lost update.
+
+The tests run against the app's database (SQLite by default). Set
+STRESS_POSTGRES_URL to a scratch PostgreSQL database, whose tables are
+dropped and recreated, to run them there as well. Throughput and
+per-purchase latency (which includes time spent waiting on locks) are
+printed; run pytest with -s to see them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from app import crud, models
+from app.config import settings
+from app.db.session import Base, SessionLocal, engine
+
+PURCHASE_THREADS = 8
+PURCHASES_PER_THREAD = 40
+RESTOCK_THREADS = 2
+RESTOCKS_PER_THREAD = 10
+RESTOCK_QUANTITY = 5
+INITIAL_QUANTITY = 100
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def session_factory(request):
+    if request.param == "sqlite":
+        if engine.dialect.name != "sqlite":
+            pytest.skip("the app database is not SQLite")
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        yield SessionLocal
+        return
+
+    url = os.environ.get("STRESS_POSTGRES_URL")
+    if not url:
+        pytest.skip("set STRESS_POSTGRES_URL to stress PostgreSQL")
+    pg_engine = create_engine(url, pool_size=PURCHASE_THREADS + RESTOCK_THREADS + 2)
+    Base.metadata.drop_all(bind=pg_engine)
+    Base.metadata.create_all(bind=pg_engine)
+    try:
+        yield sessionmaker(autocommit=False, autoflush=False, bind=pg_engine)
+    finally:
+        pg_engine.dispose()
+
+
+def _create_sweets(session_factory, count: int) -> list[int]:
+    with session_factory() as db:
+        ids = db.execute(
+            insert(models.Sweet).returning(models.Sweet.id),
+            [
+                {"name": f"Stress {i}", "category": "stress", "price": 1.0, "quantity": INITIAL_QUANTITY}
+                for i in range(count)
+            ],
+        ).scalars().all()
+        db.commit()
+    return sorted(ids)
+
+
+def _stock(session_factory, sweet_ids) -> dict[int, int]:
+    with session_factory() as db:
+        return crud._stock_levels(db, sweet_ids)
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _stress(session_factory, sweet_ids: list[int], label: str, background=None):
+    """
+    Run the purchase and restock threads (and background(db, stop), if given)
+    together. Returns the per-sweet totals of purchased and restocked units.
+    """
+    start_line = threading.Barrier(PURCHASE_THREADS + RESTOCK_THREADS)
+    lock = threading.Lock()
+    purchased = {sweet_id: 0 for sweet_id in sweet_ids}
+    restocked = {sweet_id: 0 for sweet_id in sweet_ids}
+    latencies, out_of_stock, errors = [], [0], []
+
+    def buyer(number: int):
+        bought = {sweet_id: 0 for sweet_id in sweet_ids}
+        timings, misses = [], 0
+        with session_factory() as db:
+            start_line.wait()
+            for i in range(PURCHASES_PER_THREAD):
+                first = sweet_ids[(number + i) % len(sweet_ids)]
+                began = time.perf_counter()
+                try:
+                    if i % 2:
+                        # Multi-line purchases take sweets in id order; this exercises that.
+                        lines = [(sweet_id, 1) for sweet_id in sweet_ids]
+                        result, error = crud.purchase_sweets(db, lines)
+                    else:
+                        lines = [(first, 1)]
+                        result, error = crud.purchase_sweet(db, first)
+                except Exception as exc:  # a lock timeout or deadlock is a failure too
+                    db.rollback()
+                    errors.append(f"{exc.__class__.__name__}: {exc}")
+                    continue
+                timings.append(time.perf_counter() - began)
+                if error == "out_of_stock":
+                    misses += 1
+                elif error:
+                    errors.append(error)
+                else:
+                    for sweet_id, quantity in lines:
+                        bought[sweet_id] += quantity
+        with lock:
+            for sweet_id, quantity in bought.items():
+                purchased[sweet_id] += quantity
+            latencies.extend(timings)
+            out_of_stock[0] += misses
+
+    def restocker(number: int):
+        added = {sweet_id: 0 for sweet_id in sweet_ids}
+        with session_factory() as db:
+            start_line.wait()
+            for i in range(RESTOCKS_PER_THREAD):
+                sweet_id = sweet_ids[(number + i) % len(sweet_ids)]
+                try:
+                    _, error = crud.restock_sweet(db, sweet_id, RESTOCK_QUANTITY)
+                except Exception as exc:
+                    db.rollback()
+                    errors.append(f"{exc.__class__.__name__}: {exc}")
+                    continue
+                if error:
+                    errors.append(error)
+                else:
+                    added[sweet_id] += RESTOCK_QUANTITY
+        with lock:
+            for sweet_id, quantity in added.items():
+                restocked[sweet_id] += quantity
+
+    stop = threading.Event()
+    helper = None
+    if background is not None:
+        helper = threading.Thread(target=lambda: _run_background(session_factory, background, stop, errors))
+        helper.start()
+    began = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=PURCHASE_THREADS + RESTOCK_THREADS) as pool:
+            jobs = [pool.submit(buyer, n) for n in range(PURCHASE_THREADS)]
+            jobs += [pool.submit(restocker, n) for n in range(RESTOCK_THREADS)]
+            for job in jobs:
+                job.result()
+    finally:
+        stop.set()
+        if helper is not None:
+            helper.join()
+    elapsed = time.perf_counter() - began
+
+    assert errors == []
+    latencies.sort()
+    units = sum(purchased.values())
+    print(
+        f"\n[{label}] {len(latencies)} purchase calls ({units} units, {out_of_stock[0]} out of stock) "
+        f"in {elapsed:.2f} s: {len(latencies) / elapsed:.0f} purchases/s; latency incl. lock wait "
+        f"p50 {_percentile(latencies, 0.5) * 1000:.1f} ms, p99 {_percentile(latencies, 0.99) * 1000:.1f} ms, "
+        f"max {latencies[-1] * 1000:.1f} ms"
+    )
+    # Demand exceeds supply, so some purchases must have been refused at zero stock.
+    assert out_of_stock[0] > 0
+    return purchased, restocked
+
+
+def _run_background(session_factory, job, stop: threading.Event, errors: list):
+    with session_factory() as db:
+        while not stop.is_set():
+            try:
+                job(db)
+            except Exception as exc:
+                db.rollback()
+                errors.append(f"{exc.__class__.__name__}: {exc}")
+            time.sleep(0.005)
+
+
+def _assert_exact(session_factory, sweet_ids, purchased, restocked):
+    final = _stock(session_factory, sweet_ids)
+    for sweet_id in sweet_ids:
+        expected = INITIAL_QUANTITY + restocked[sweet_id] - purchased[sweet_id]
+        assert final[sweet_id] == expected, f"sweet {sweet_id}: {final[sweet_id]} in stock, expected {expected}"
+        assert final[sweet_id] >= 0
+
+
+class TestPurchaseContention:
+    """Concurrent purchases and restocks never oversell or lose an update."""
+
+    def test_counter_mode(self, session_factory, monkeypatch):
+        monkeypatch.setattr(settings, "inventory_mode", "counter")
+        sweet_ids = _create_sweets(session_factory, 2)
+        purchased, restocked = _stress(session_factory, sweet_ids, "counter")
+        _assert_exact(session_factory, sweet_ids, purchased, restocked)
+
+    def test_sharded_mode(self, session_factory, monkeypatch):
+        monkeypatch.setattr(settings, "inventory_mode", "counter")
+        sweet_ids = _create_sweets(session_factory, 2)
+        with session_factory() as db:
+            for sweet_id in sweet_ids:
+                _, error = crud.shard_sweet_stock(db, sweet_id, 4)
+                assert error is None
+        purchased, restocked = _stress(session_factory, sweet_ids, "sharded")
+        _assert_exact(session_factory, sweet_ids, purchased, restocked)
+        with session_factory() as db:
+            buckets = db.execute(select(models.SweetStockBucket.quantity)).scalars().all()
+        assert min(buckets) >= 0
+
+    def test_ledger_mode_with_compaction(self, session_factory, monkeypatch):
+        monkeypatch.setattr(settings, "inventory_mode", "ledger")
+        sweet_ids = _create_sweets(session_factory, 2)
+        purchased, restocked = _stress(
+            session_factory, sweet_ids, "ledger", background=lambda db: crud.compact_ledger(db, limit=50)
+        )
+        _assert_exact(session_factory, sweet_ids, purchased, restocked)
+        # Once everything is compacted, sweets.quantity alone holds the same totals.
+        with session_factory() as db:
+            while crud.compact_ledger(db):
+                pass
+            stored = dict(db.execute(select(models.Sweet.id, models.Sweet.quantity)).all())
+        for sweet_id in sweet_ids:
+            assert stored[sweet_id] == INITIAL_QUANTITY + restocked[sweet_id] - purchased[sweet_id]
@@ -406,3 +406,658 @@ class TestSweetDeletionVisibility:
         assert list_resp.status_code == 200
         ids = [s["id"] for s in list_resp.json()]
         assert sweet["id"] not in ids
+
+
+class TestWithoutUpdateReturning:
+    """Dialects without UPDATE ... RETURNING update first, then re-read the row."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        from app.db.session import async_engine
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        for bound in (engine, async_engine and async_engine.sync_engine):
+            if bound is not None:
+                monkeypatch.setattr(bound.dialect, "update_returning", False)
+        admin_token = _get_auth_token("admin_no_returning", "secret123")
+        self.headers = {"Authorization": f"Bearer {admin_token}"}
+        self.sweet = _create_sweet("Peda", 2, admin_token)
+        yield
+
+    def test_purchase_and_short_stock(self):
+        url = f"/api/sweets/{self.sweet['id']}/purchase"
+        assert client.post(url, headers=self.headers).json()["quantity"] == 1
+        bulk = client.post(
+            "/api/sweets/purchase",
+            json={"items": [{"sweet_id": self.sweet["id"], "quantity": 2}]},
+            headers=self.headers
+        )
+        assert bulk.status_code == 400
+        assert client.post(url, headers=self.headers).json()["quantity"] == 0
+        response = client.post(url, headers=self.headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Out of stock"
+
+    def test_restock_and_price(self):
+        restocked = client.post(
+            f"/api/sweets/{self.sweet['id']}/restock", json={"quantity": 5}, headers=self.headers
+        )
+        assert restocked.json()["quantity"] == 7
+        repriced = client.put(f"/api/sweets/{self.sweet['id']}", json={"price": 6.5}, headers=self.headers)
+        assert (repriced.json()["price"], repriced.json()["quantity"]) == (6.5, 7)
+        batch = client.put(
+            "/api/sweets/prices", json={"items": [{"sweet_id": self.sweet["id"], "price": 7.0}]}, headers=self.headers
+        )
+        assert batch.json()[0]["price"] == 7.0
+
+    def test_not_found(self):
+        assert client.post("/api/sweets/999/purchase", headers=self.headers).status_code == 404
+        assert client.post("/api/sweets/999/restock", json={"quantity": 1}, headers=self.headers).status_code == 404
+        assert client.put("/api/sweets/999", json={"price": 1.0}, headers=self.headers).status_code == 404
+
+
+class TestBulkPurchase:
+    """Tests for multi-item purchases (POST /api/sweets/purchase)."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        yield
+
+    def test_bulk_purchase_decrements_every_line(self):
+        """Each line should be decremented by its own quantity."""
+        admin_token = _get_auth_token("admin_bulk1", "secret123")
+        gulab = _create_sweet("Gulab Jamun", 10, admin_token)
+        jalebi = _create_sweet("Jalebi", 5, admin_token)
+
+        buyer_token = _get_auth_token("bulk_buyer1", "secret123")
+        response = client.post(
+            "/api/sweets/purchase",
+            json={"items": [
+                {"sweet_id": gulab["id"], "quantity": 6},
+                {"sweet_id": jalebi["id"], "quantity": 4},
+            ]},
+            headers={"Authorization": f"Bearer {buyer_token}"}
+        )
+
+        assert response.status_code == 200
+        data = {s["id"]: s["quantity"] for s in response.json()}
+        assert data == {gulab["id"]: 4, jalebi["id"]: 1}
+
+    def test_bulk_purchase_merges_repeated_lines(self):
+        """Repeated sweet ids should be summed into one decrement."""
+        admin_token = _get_auth_token("admin_bulk2", "secret123")
+        sweet = _create_sweet("Barfi", 5, admin_token)
+
+        buyer_token = _get_auth_token("bulk_buyer2", "secret123")
+        response = client.post(
+            "/api/sweets/purchase",
+            json={"items": [
+                {"sweet_id": sweet["id"], "quantity": 2},
+                {"sweet_id": sweet["id"], "quantity": 3},
+            ]},
+            headers={"Authorization": f"Bearer {buyer_token}"}
+        )
+
+        assert response.status_code == 200
+        assert len(response.json()) == 1
+        assert response.json()[0]["quantity"] == 0
+
+    def test_bulk_purchase_is_all_or_nothing(self):
+        """A short line should fail the whole purchase and report the shortage."""
+        admin_token = _get_auth_token("admin_bulk3", "secret123")
+        plenty = _create_sweet("Plenty", 10, admin_token)
+        scarce = _create_sweet("Scarce", 1, admin_token)
+
+        buyer_token = _get_auth_token("bulk_buyer3", "secret123")
+        response = client.post(
+            "/api/sweets/purchase",
+            json={"items": [
+                {"sweet_id": plenty["id"], "quantity": 2},
+                {"sweet_id": scarce["id"], "quantity": 3},
+            ]},
+            headers={"Authorization": f"Bearer {buyer_token}"}
+        )
+
+        assert response.status_code == 400
+        shortages = response.json()["detail"]["shortages"]
+        assert shortages == [{"sweet_id": scarce["id"], "requested": 3, "available": 1}]
+
+        quantities = {s["id"]: s["quantity"] for s in client.get("/api/sweets").json()}
+        assert quantities[plenty["id"]] == 10
+        assert quantities[scarce["id"]] == 1
+
+    def test_bulk_purchase_unknown_sweet(self):
+        """An unknown sweet id should fail the purchase with 404."""
+        admin_token = _get_auth_token("admin_bulk4", "secret123")
+        sweet = _create_sweet("Known", 5, admin_token)
+
+        buyer_token = _get_auth_token("bulk_buyer4", "secret123")
+        response = client.post(
+            "/api/sweets/purchase",
+            json={"items": [
+                {"sweet_id": sweet["id"], "quantity": 1},
+                {"sweet_id": 9999, "quantity": 1},
+            ]},
+            headers={"Authorization": f"Bearer {buyer_token}"}
+        )
+
+        assert response.status_code == 404
+        assert response.json()["detail"]["sweet_ids"] == [9999]
+
+    def test_bulk_purchase_requires_authentication(self):
+        response = client.post("/api/sweets/purchase", json={"items": [{"sweet_id": 1, "quantity": 1}]})
+        assert response.status_code == 401
+
+
+class TestShardedStock:
+    """Tests for sharded stock buckets (PUT /api/sweets/{sweet_id}/stock-buckets)."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        from app.config import settings
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        monkeypatch.setattr(settings, "inventory_mode", "counter")
+        yield
+
+    def _shard(self, sweet_id: int, buckets: int, token: str):
+        return client.put(
+            f"/api/sweets/{sweet_id}/stock-buckets",
+            json={"buckets": buckets},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    def test_sharding_requires_admin(self):
+        sweet = _create_sweet("Hot Sweet", 10)
+        user_token = _get_auth_token("shard_user", "secret123")
+        assert self._shard(sweet["id"], 4, user_token).status_code == 403
+
+    def test_sharded_quantity_reports_exact_total(self):
+        admin_token = _get_auth_token("admin_shard1", "secret123")
+        sweet = _create_sweet("Festival Laddu", 10, admin_token)
+
+        response = self._shard(sweet["id"], 4, admin_token)
+        assert response.status_code == 200
+        assert response.json()["quantity"] == 10
+
+        listed = {s["id"]: s["quantity"] for s in client.get("/api/sweets").json()}
+        assert listed[sweet["id"]] == 10
+
+    def test_sharded_purchases_sell_out_exactly(self):
+        """Buckets rebalance as they run dry, so every unit can be sold and no more."""
+        admin_token = _get_auth_token("admin_shard2", "secret123")
+        sweet = _create_sweet("Flash Sale", 7, admin_token)
+        self._shard(sweet["id"], 3, admin_token)
+
+        buyer_token = _get_auth_token("shard_buyer2", "secret123")
+        headers = {"Authorization": f"Bearer {buyer_token}"}
+        for expected in range(6, -1, -1):
+            response = client.post(f"/api/sweets/{sweet['id']}/purchase", headers=headers)
+            assert response.status_code == 200
+            assert response.json()["quantity"] == expected
+
+        response = client.post(f"/api/sweets/{sweet['id']}/purchase", headers=headers)
+        assert response.status_code == 400
+
+    def test_sharded_bulk_purchase_spans_buckets(self):
+        """A line larger than any single bucket is served by rebalancing."""
+        admin_token = _get_auth_token("admin_shard3", "secret123")
+        sweet = _create_sweet("Big Order", 8, admin_token)
+        self._shard(sweet["id"], 4, admin_token)
+
+        buyer_token = _get_auth_token("shard_buyer3", "secret123")
+        response = client.post(
+            "/api/sweets/purchase",
+            json={"items": [{"sweet_id": sweet["id"], "quantity": 5}]},
+            headers={"Authorization": f"Bearer {buyer_token}"}
+        )
+        assert response.status_code == 200
+        assert response.json()[0]["quantity"] == 3
+
+    def test_sharded_restock_and_unshard(self):
+        admin_token = _get_auth_token("admin_shard4", "secret123")
+        sweet = _create_sweet("Restock Shards", 2, admin_token)
+        self._shard(sweet["id"], 3, admin_token)
+
+        response = client.post(
+            f"/api/sweets/{sweet['id']}/restock",
+            json={"quantity": 10},
+            headers={"Authorization": f"Bearer {admin_token}"}
+        )
+        assert response.status_code == 200
+        assert response.json()["quantity"] == 12
+
+        response = self._shard(sweet["id"], 0, admin_token)
+        assert response.status_code == 200
+        assert response.json()["quantity"] == 12
+
+    def test_shard_nonexistent_sweet(self):
+        admin_token = _get_auth_token("admin_shard5", "secret123")
+        assert self._shard(9999, 4, admin_token).status_code == 404
+
+
+class TestBatchAdminUpdates:
+    """Tests for batch restock (POST /api/sweets/restock) and prices (PUT /api/sweets/prices)."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.admin_token = _get_auth_token("admin_batch", "secret123")
+        self.headers = {"Authorization": f"Bearer {self.admin_token}"}
+        yield
+
+    def test_batch_restock_adds_to_every_line(self):
+        """Each sweet should gain its (summed) quantity; rows come back in request order."""
+        ladoo = _create_sweet("Ladoo", 1, self.admin_token)
+        peda = _create_sweet("Peda", 0, self.admin_token)
+        client.put(f"/api/sweets/{peda['id']}/stock-buckets", json={"buckets": 3}, headers=self.headers)
+
+        response = client.post(
+            "/api/sweets/restock",
+            json={"items": [
+                {"sweet_id": peda["id"], "quantity": 7},
+                {"sweet_id": ladoo["id"], "quantity": 4},
+                {"sweet_id": peda["id"], "quantity": 2},
+            ]},
+            headers=self.headers
+        )
+
+        assert response.status_code == 200
+        assert [(s["id"], s["quantity"]) for s in response.json()] == [(peda["id"], 9), (ladoo["id"], 5)]
+
+    def test_batch_prices_update_every_line(self):
+        """The last price given for a sweet wins."""
+        ladoo = _create_sweet("Ladoo", 1, self.admin_token)
+        peda = _create_sweet("Peda", 1, self.admin_token)
+
+        response = client.put(
+            "/api/sweets/prices",
+            json={"items": [
+                {"sweet_id": ladoo["id"], "price": 7.0},
+                {"sweet_id": peda["id"], "price": 3.5},
+                {"sweet_id": ladoo["id"], "price": 8.0},
+            ]},
+            headers=self.headers
+        )
+
+        assert response.status_code == 200
+        assert [(s["id"], s["price"]) for s in response.json()] == [(ladoo["id"], 8.0), (peda["id"], 3.5)]
+        listed = {s["id"]: s["price"] for s in client.get("/api/sweets").json()}
+        assert listed == {ladoo["id"]: 8.0, peda["id"]: 3.5}
+
+    def test_batch_is_all_or_nothing(self):
+        """A missing sweet should roll back the whole batch and be reported."""
+        ladoo = _create_sweet("Ladoo", 1, self.admin_token)
+
+        response = client.post(
+            "/api/sweets/restock",
+            json={"items": [{"sweet_id": ladoo["id"], "quantity": 5}, {"sweet_id": 999, "quantity": 1}]},
+            headers=self.headers
+        )
+        assert response.status_code == 404
+        assert response.json()["detail"]["sweet_ids"] == [999]
+
+        response = client.put(
+            "/api/sweets/prices",
+            json={"items": [{"sweet_id": 999, "price": 1.0}, {"sweet_id": ladoo["id"], "price": 9.0}]},
+            headers=self.headers
+        )
+        assert response.status_code == 404
+
+        sweet = client.get("/api/sweets").json()[0]
+        assert (sweet["quantity"], sweet["price"]) == (1, 5.0)
+
+    def test_batch_requires_admin_and_valid_lines(self):
+        """Non-admins are rejected; invalid prices and empty batches fail validation."""
+        ladoo = _create_sweet("Ladoo", 1, self.admin_token)
+        user_token = _get_auth_token("batch_user", "secret123")
+        response = client.post(
+            "/api/sweets/restock",
+            json={"items": [{"sweet_id": ladoo["id"], "quantity": 5}]},
+            headers={"Authorization": f"Bearer {user_token}"}
+        )
+        assert response.status_code == 403
+        assert client.put("/api/sweets/prices", json={"items": []}, headers=self.headers).status_code == 422
+        assert client.put(
+            "/api/sweets/prices", json={"items": [{"sweet_id": ladoo["id"], "price": 0}]}, headers=self.headers
+        ).status_code == 422
+
+
+class TestIdempotencyKeys:
+    """Purchases and checkouts sent with an Idempotency-Key are applied once and replayed on retry."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.admin_token = _get_auth_token("admin_idem", "secret123")
+        self.headers = {"Authorization": f"Bearer {_get_auth_token('idem_buyer', 'secret123')}"}
+        self.sweet = _create_sweet("Soan Papdi", 5, self.admin_token)
+        yield
+
+    def _purchase(self, key: str, headers=None):
+        return client.post(
+            f"/api/sweets/{self.sweet['id']}/purchase",
+            headers={**(headers or self.headers), "Idempotency-Key": key}
+        )
+
+    def _quantity(self) -> int:
+        return client.get("/api/sweets").json()[0]["quantity"]
+
+    def test_retry_replays_without_decrementing_again(self):
+        first = self._purchase("retry-1")
+        second = self._purchase("retry-1")
+
+        assert first.status_code == second.status_code == 200
+        assert first.json() == second.json() == {**self.sweet, "quantity": 4}
+        assert first.headers["Idempotent-Replayed"] == "false"
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert self._quantity() == 4
+
+        assert self._purchase("retry-2").json()["quantity"] == 3
+
+    def test_replay_survives_front_cache_loss(self):
+        from app.idempotency import front_cache
+        self._purchase("durable")
+        front_cache.clear()
+        assert self._purchase("durable").headers["Idempotent-Replayed"] == "true"
+        assert self._quantity() == 4
+
+    def test_key_reused_for_different_request_is_rejected(self):
+        self._purchase("reused")
+        response = client.post(
+            "/api/sweets/purchase",
+            json={"items": [{"sweet_id": self.sweet["id"], "quantity": 2}]},
+            headers={**self.headers, "Idempotency-Key": "reused"}
+        )
+        assert response.status_code == 422
+        assert self._quantity() == 4
+
+    def test_keys_are_scoped_per_user(self):
+        other = {"Authorization": f"Bearer {_get_auth_token('idem_other', 'secret123')}"}
+        self._purchase("shared")
+        assert self._purchase("shared", headers=other).headers["Idempotent-Replayed"] == "false"
+        assert self._quantity() == 3
+
+    def test_failures_are_not_stored(self):
+        empty = _create_sweet("Empty Box", 0, self.admin_token)
+        url = f"/api/sweets/{empty['id']}/purchase"
+        headers = {**self.headers, "Idempotency-Key": "after-restock"}
+        assert client.post(url, headers=headers).status_code == 400
+        client.post(
+            f"/api/sweets/{empty['id']}/restock", json={"quantity": 1},
+            headers={"Authorization": f"Bearer {self.admin_token}"}
+        )
+        assert client.post(url, headers=headers).json()["quantity"] == 0
+
+    def test_expired_keys_run_again(self):
+        from datetime import datetime
+        from app import models
+        from app.db.session import SessionLocal
+        from app.idempotency import front_cache
+        self._purchase("old")
+        db = SessionLocal()
+        db.query(models.IdempotencyKey).update({"expires_at": datetime(2000, 1, 1)})
+        db.commit()
+        db.close()
+        front_cache.clear()
+
+        assert self._purchase("old").headers["Idempotent-Replayed"] == "false"
+        assert self._quantity() == 3
+
+    def test_concurrent_duplicate_rolls_back_and_replays(self):
+        """If another request committed the key first, this one's stock change is rolled back."""
+        from functools import partial
+        from app import crud, idempotency
+        from app.db.session import SessionLocal
+        winner = self._purchase("race").content
+        idempotency.front_cache.clear()
+
+        db = SessionLocal()
+        try:
+            user_id = crud.get_user_by_username(db, "idem_buyer").id
+            stored, error = idempotency.execute(
+                db, user_id=user_id, key="race",
+                fingerprint=idempotency.fingerprint("POST", f"/api/sweets/{self.sweet['id']}/purchase", b""),
+                encode=lambda result: b"{}",
+                call=partial(crud.purchase_sweet, sweet_id=self.sweet["id"]),
+            )
+        finally:
+            db.close()
+        assert error is None
+        assert stored.body == winner
+        assert self._quantity() == 4
+
+    def test_orders_are_idempotent(self):
+        headers = {**self.headers, "Idempotency-Key": "order-1"}
+        body = {"items": [{"sweet_id": self.sweet["id"], "quantity": 2}]}
+        first = client.post("/api/orders", json=body, headers=headers)
+        second = client.post("/api/orders", json=body, headers=headers)
+        assert first.status_code == 200
+        assert second.json() == first.json()
+        assert self._quantity() == 3
+
+
+class TestLedgerMode:
+    """INVENTORY_MODE=ledger appends stock deltas instead of updating sweets.quantity."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        from app.config import settings
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        monkeypatch.setattr(settings, "inventory_mode", "ledger")
+        self.admin_token = _get_auth_token("admin_ledger", "secret123")
+        self.headers = {"Authorization": f"Bearer {self.admin_token}"}
+        self.sweet = _create_sweet("Chikki", 3, self.admin_token)
+        yield
+
+    def _stored_quantity(self) -> int:
+        from app import models
+        from app.db.session import SessionLocal
+        db = SessionLocal()
+        try:
+            return db.get(models.Sweet, self.sweet["id"]).quantity
+        finally:
+            db.close()
+
+    def test_changes_append_deltas(self):
+        """Purchases and restocks are recorded as deltas; the visible quantity includes them."""
+        assert client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers).json()["quantity"] == 2
+        restocked = client.post(f"/api/sweets/{self.sweet['id']}/restock", json={"quantity": 5}, headers=self.headers)
+        assert restocked.json()["quantity"] == 7
+        assert self._stored_quantity() == 3
+
+        ledger = client.get(f"/api/sweets/{self.sweet['id']}/ledger", headers=self.headers).json()
+        assert [(entry["delta"], entry["reason"], entry["compacted"]) for entry in ledger] == [
+            (5, "restock", False), (-1, "purchase", False)
+        ]
+
+    def test_deleting_a_sweet_keeps_its_history(self):
+        """Ledger rows outlive the sweet with sweet_id cleared, and the compactor skips them."""
+        from sqlalchemy import select
+        from app import crud, models
+        from app.db.session import SessionLocal
+        client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers)
+        client.post(f"/api/sweets/{self.sweet['id']}/restock", json={"quantity": 5}, headers=self.headers)
+
+        assert client.delete(f"/api/sweets/{self.sweet['id']}", headers=self.headers).status_code == 200
+        with SessionLocal() as db:
+            rows = db.execute(select(models.StockLedgerEntry.sweet_id, models.StockLedgerEntry.delta)).all()
+            assert sorted(rows, key=lambda row: row.delta) == [(None, -1), (None, 5)]
+            assert crud.compact_ledger(db) == 2
+
+    def test_stock_checks_stay_strict(self):
+        """Deltas can never take stock below zero, and multi-line purchases stay all or nothing."""
+        response = client.post(
+            "/api/sweets/purchase",
+            json={"items": [{"sweet_id": self.sweet["id"], "quantity": 4}]},
+            headers=self.headers
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"]["shortages"][0]["available"] == 3
+
+        for _ in range(3):
+            assert client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers).status_code == 200
+        assert client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers).status_code == 400
+        assert client.post("/api/sweets/999/purchase", headers=self.headers).status_code == 404
+
+    def test_compaction_folds_deltas(self):
+        """The compactor moves deltas into sweets.quantity without changing the visible stock."""
+        from app import crud
+        from app.db.session import SessionLocal
+        client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers)
+        client.post(f"/api/sweets/{self.sweet['id']}/restock", json={"quantity": 10}, headers=self.headers)
+
+        db = SessionLocal()
+        try:
+            assert crud.compact_ledger(db, limit=1) == 1
+            assert crud.compact_ledger(db) == 1
+            assert crud.compact_ledger(db) == 0
+        finally:
+            db.close()
+
+        assert self._stored_quantity() == 12
+        assert client.get("/api/sweets").json()[0]["quantity"] == 12
+        ledger = client.get(f"/api/sweets/{self.sweet['id']}/ledger", headers=self.headers).json()
+        assert all(entry["compacted"] for entry in ledger)
+
+    def test_compaction_without_returning(self, monkeypatch):
+        """The select-then-update fallback claims only deltas that are still pending."""
+        from app import crud
+        from app.db.session import SessionLocal
+        client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers)
+        client.post(f"/api/sweets/{self.sweet['id']}/restock", json={"quantity": 4}, headers=self.headers)
+        monkeypatch.setattr(engine.dialect, "update_returning", False)
+        db = SessionLocal()
+        try:
+            assert crud.compact_ledger(db) == 2
+            assert crud.compact_ledger(db) == 0
+        finally:
+            db.close()
+        assert self._stored_quantity() == 6
+
+    def test_stock_reads_skip_compacted_history(self):
+        """Summing pending deltas must not walk a sweet's compacted history."""
+        if engine.dialect.name != "sqlite":
+            pytest.skip("SQLite query plan")
+        from datetime import datetime
+        from sqlalchemy import insert, select
+        from sqlalchemy.dialects import sqlite
+        from app import crud, models
+        from app.db.session import SessionLocal
+        db = SessionLocal()
+        try:
+            db.execute(insert(models.StockLedgerEntry), [
+                {"sweet_id": self.sweet["id"], "delta": 1, "reason": "restock",
+                 "created_at": datetime(2026, 1, 1), "compacted": True}
+                for _ in range(5000)
+            ])
+            db.commit()
+            query = select(*crud.SWEET_COLUMNS).where(models.Sweet.id == self.sweet["id"])
+            sql = str(query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+            plan = [row[3] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+        finally:
+            db.close()
+        ledger_steps = [step for step in plan if "stock_ledger" in step]
+        assert len(ledger_steps) == 1
+        assert "ix_stock_ledger_pending" in ledger_steps[0] or "compacted=?" in ledger_steps[0]
+
+    def test_concurrent_purchases_never_oversell(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from app import crud
+        from app.db.session import SessionLocal
+
+        def buy(_):
+            db = SessionLocal()
+            try:
+                return crud.purchase_sweet(db, self.sweet["id"])[1]
+            finally:
+                db.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            errors = list(pool.map(buy, range(12)))
+        assert errors.count(None) == 3
+        assert errors.count("out_of_stock") == 9
+        assert client.get("/api/sweets").json()[0]["quantity"] == 0
+
+    def test_sharding_is_rejected(self):
+        response = client.put(f"/api/sweets/{self.sweet['id']}/stock-buckets", json={"buckets": 2}, headers=self.headers)
+        assert response.status_code == 409
+
+
+class TestLowStock:
+    """Tests for reorder thresholds and GET /api/admin/low-stock."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch):
+        from app.config import settings
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        monkeypatch.setattr(settings, "inventory_mode", "counter")
+        self.admin_token = _get_auth_token("admin_lowstock", "secret123")
+        self.headers = {"Authorization": f"Bearer {self.admin_token}"}
+        yield
+
+    def _threshold(self, sweet_id: int, threshold, headers=None):
+        return client.put(
+            f"/api/sweets/{sweet_id}/reorder-threshold",
+            json={"reorder_threshold": threshold},
+            headers=headers or self.headers
+        )
+
+    def _low_stock(self):
+        response = client.get("/api/admin/low-stock", headers=self.headers)
+        assert response.status_code == 200
+        return [(sweet["name"], sweet["quantity"], sweet["reorder_threshold"]) for sweet in response.json()]
+
+    def test_endpoints_require_admin(self):
+        sweet = _create_sweet("Peda", 5, self.admin_token)
+        user_headers = {"Authorization": f"Bearer {_get_auth_token('lowstock_user', 'secret123')}"}
+        assert self._threshold(sweet["id"], 2, user_headers).status_code == 403
+        assert client.get("/api/admin/low-stock", headers=user_headers).status_code == 403
+        assert self._threshold(999, 2).status_code == 404
+        assert self._threshold(sweet["id"], -1).status_code == 422
+
+    def test_purchase_crossing_threshold_is_listed(self):
+        """A sweet appears once a purchase takes it to its threshold, most urgent first."""
+        peda = _create_sweet("Peda", 3, self.admin_token)
+        barfi = _create_sweet("Barfi", 1, self.admin_token)
+        _create_sweet("Halwa", 0, self.admin_token)  # no threshold: never listed
+        assert self._threshold(peda["id"], 2).json()["reorder_threshold"] == 2
+        self._threshold(barfi["id"], 5)
+        assert self._low_stock() == [("Barfi", 1, 5)]
+
+        client.post(f"/api/sweets/{peda['id']}/purchase", headers=self.headers)
+        assert self._low_stock() == [("Barfi", 1, 5), ("Peda", 2, 2)]
+
+        client.post(f"/api/sweets/{barfi['id']}/restock", json={"quantity": 10}, headers=self.headers)
+        self._threshold(peda["id"], None)
+        assert self._low_stock() == []
+
+    def test_sharded_and_ledger_stock_are_counted(self, monkeypatch):
+        """Stock held in buckets or pending ledger deltas is included in the comparison."""
+        from app.config import settings
+        sharded = _create_sweet("Jalebi", 10, self.admin_token)
+        client.put(f"/api/sweets/{sharded['id']}/stock-buckets", json={"buckets": 4}, headers=self.headers)
+        self._threshold(sharded["id"], 3)
+        assert self._low_stock() == []
+        client.post(
+            "/api/sweets/purchase",
+            json={"items": [{"sweet_id": sharded["id"], "quantity": 7}]},
+            headers=self.headers
+        )
+        assert self._low_stock() == [("Jalebi", 3, 3)]
+
+        monkeypatch.setattr(settings, "inventory_mode", "ledger")
+        ledger = _create_sweet("Rasgulla", 4, self.admin_token)
+        self._threshold(ledger["id"], 2)
+        client.post(
+            "/api/sweets/purchase",
+            json={"items": [{"sweet_id": ledger["id"], "quantity": 3}]},
+            headers=self.headers
+        )
+        assert self._low_stock() == [("Rasgulla", 1, 2), ("Jalebi", 3, 3)]
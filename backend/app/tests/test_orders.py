@@ -0,0 +1,156 @@
+"""
+Order checkout tests (POST /api/orders, GET /api/orders/{order_id}).
+"""
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from app.main import app
+from app.db.session import Base, engine
+
+client = TestClient(app)
+
+
+def _get_auth_token(username: str, password: str) -> str:
+    """Helper to register a user and return JWT token."""
+    client.post(
+        "/api/auth/register",
+        json={"username": username, "password": password, "full_name": f"{username.capitalize()} User"}
+    )
+    response = client.post("/api/auth/login", data={"username": username, "password": password})
+    return response.json()["access_token"]
+
+
+class TestCheckout:
+    """Tests for creating and reading orders."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.admin_headers = {"Authorization": f"Bearer {_get_auth_token('admin_orders', 'secret123')}"}
+        self.buyer_headers = {"Authorization": f"Bearer {_get_auth_token('order_buyer', 'secret123')}"}
+        self.ladoo = self._create_sweet("Ladoo", 2.5, 10)
+        self.barfi = self._create_sweet("Barfi", 4.0, 3)
+        yield
+
+    def _create_sweet(self, name: str, price: float, quantity: int) -> dict:
+        return client.post(
+            "/api/sweets",
+            json={"name": name, "category": "order", "price": price, "quantity": quantity},
+            headers=self.admin_headers
+        ).json()
+
+    def test_checkout_creates_order_and_takes_stock(self):
+        """Every line is recorded at its current price and its stock is decremented."""
+        response = client.post(
+            "/api/orders",
+            json={"items": [
+                {"sweet_id": self.ladoo["id"], "quantity": 4},
+                {"sweet_id": self.barfi["id"], "quantity": 3},
+                {"sweet_id": self.ladoo["id"], "quantity": 1},
+            ]},
+            headers=self.buyer_headers
+        )
+
+        assert response.status_code == 200
+        order = response.json()
+        assert order["items"] == [
+            {"sweet_id": self.ladoo["id"], "quantity": 5, "unit_price": 2.5},
+            {"sweet_id": self.barfi["id"], "quantity": 3, "unit_price": 4.0},
+        ]
+        assert order["total"] == 24.5
+        stock = {s["id"]: s["quantity"] for s in client.get("/api/sweets").json()}
+        assert stock == {self.ladoo["id"]: 5, self.barfi["id"]: 0}
+
+    def test_failed_checkout_changes_nothing(self):
+        """A short line fails the whole order: no stock taken, no order stored."""
+        response = client.post(
+            "/api/orders",
+            json={"items": [
+                {"sweet_id": self.ladoo["id"], "quantity": 1},
+                {"sweet_id": self.barfi["id"], "quantity": 4},
+            ]},
+            headers=self.buyer_headers
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"]["shortages"] == [
+            {"sweet_id": self.barfi["id"], "requested": 4, "available": 3}
+        ]
+        assert client.get("/api/orders/1", headers=self.admin_headers).status_code == 404
+
+        response = client.post("/api/orders", json={"items": [{"sweet_id": 999}]}, headers=self.buyer_headers)
+        assert response.status_code == 404
+        assert {s["quantity"] for s in client.get("/api/sweets").json()} == {10, 3}
+
+    def test_order_keeps_checkout_price(self):
+        """Later price changes don't rewrite past orders."""
+        order = client.post(
+            "/api/orders", json={"items": [{"sweet_id": self.ladoo["id"]}]}, headers=self.buyer_headers
+        ).json()
+        client.put(f"/api/sweets/{self.ladoo['id']}", json={"price": 9.0}, headers=self.admin_headers)
+
+        response = client.get(f"/api/orders/{order['id']}", headers=self.buyer_headers)
+        assert response.status_code == 200
+        assert response.json()["items"] == [{"sweet_id": self.ladoo["id"], "quantity": 1, "unit_price": 2.5}]
+        assert response.json()["total"] == 2.5
+
+    def test_orders_are_visible_to_owner_and_admins_only(self):
+        order = client.post(
+            "/api/orders", json={"items": [{"sweet_id": self.ladoo["id"]}]}, headers=self.buyer_headers
+        ).json()
+        other_headers = {"Authorization": f"Bearer {_get_auth_token('order_other', 'secret123')}"}
+
+        assert client.get(f"/api/orders/{order['id']}", headers=other_headers).status_code == 404
+        assert client.get(f"/api/orders/{order['id']}", headers=self.admin_headers).status_code == 200
+        assert client.get(f"/api/orders/{order['id']}").status_code == 401
+
+    def test_deleting_an_ordered_sweet_keeps_the_order(self):
+        """The order line survives the sweet (SQLite enforces the foreign key too) with sweet_id cleared."""
+        order = client.post(
+            "/api/orders", json={"items": [{"sweet_id": self.ladoo["id"], "quantity": 2}]}, headers=self.buyer_headers
+        ).json()
+
+        assert client.delete(f"/api/sweets/{self.ladoo['id']}", headers=self.admin_headers).status_code == 200
+        response = client.get(f"/api/orders/{order['id']}", headers=self.buyer_headers)
+        assert response.json()["items"] == [{"sweet_id": None, "quantity": 2, "unit_price": 2.5}]
+        assert response.json()["total"] == 5.0
+
+
+        assert client.post("/api/orders", json={"items": []}, headers=self.buyer_headers).status_code == 422
+        response = client.post(
+            "/api/orders", json={"items": [{"sweet_id": self.ladoo["id"], "quantity": 0}]}, headers=self.buyer_headers
+        )
+        assert response.status_code == 422
+
+
+class TestSchemaUpgrade:
+    """create_all adds columns that older databases are missing."""
+
+    def test_missing_order_item_columns_are_added(self, tmp_path):
+        old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with old.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE order_items (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER, quantity INTEGER NOT NULL)"
+            ))
+            connection.execute(text("INSERT INTO order_items (order_id, product_id, quantity) VALUES (1, 1, 2)"))
+
+        Base.metadata.create_all(bind=old)
+
+        columns = {column["name"] for column in inspect(old).get_columns("order_items")}
+        assert {"sweet_id", "unit_price"} <= columns
+        with old.connect() as connection:
+            assert connection.execute(text("SELECT quantity, sweet_id FROM order_items")).all() == [(2, None)]
+        old.dispose()
+
+    def test_retired_indexes_are_dropped(self, tmp_path):
+        old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(bind=old)
+        with old.begin() as connection:
+            connection.execute(text("CREATE INDEX ix_stock_ledger_sweet_id ON stock_ledger (sweet_id)"))
+
+        Base.metadata.create_all(bind=old)
+
+        names = {index["name"] for index in inspect(old).get_indexes("stock_ledger")}
+        assert "ix_stock_ledger_sweet_id" not in names
+        assert {"ix_stock_ledger_pending", "ix_stock_ledger_sweet_history"} <= names
+        old.dispose()
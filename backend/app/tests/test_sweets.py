@@ -540,3 +540,614 @@ class TestSweetFields:
             headers=headers
         )
         assert response.status_code in [422, 400]
+
+
+class TestAsyncSessionBridge:
+    """CRUD functions must behave the same through an AsyncSession (ASYNC_DB=1)."""
+
+    def test_run_db_with_async_session(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        import asyncio
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from app import crud, schemas
+        from app.db.session import run_db
+
+        async def scenario():
+            async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+            async with async_engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            try:
+                async with async_sessionmaker(async_engine, expire_on_commit=False)() as db:
+                    sweet = await run_db(db, crud.create_sweet, schemas.SweetCreate(
+                        name="Async Barfi", category="async", price=2.5, quantity=3
+                    ))
+                    purchased, error = await run_db(db, crud.purchase_sweet, sweet.id)
+                    listed = await run_db(db, crud.list_sweets)
+                    return purchased, error, listed
+            finally:
+                await async_engine.dispose()
+
+        purchased, error, listed = asyncio.run(scenario())
+        assert error is None
+        assert purchased.quantity == 2
+        assert [(s.name, s.quantity) for s in listed] == [("Async Barfi", 2)]
+
+
+class TestKeysetPagination:
+    """Cursor pagination for GET /api/sweets and /api/sweets/search."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_pages", "secret123")
+        headers = {"Authorization": f"Bearer {token}"}
+        for i, price in enumerate([5.0, 3.0, 5.0, 1.0, 4.0]):
+            client.post(
+                "/api/sweets",
+                json={"name": f"Sweet {i}", "category": "paged", "price": price, "quantity": 1},
+                headers=headers
+            )
+        yield
+
+    def _walk(self, url: str, **params):
+        seen, cursor = [], None
+        while True:
+            query = dict(params, limit=2)
+            if cursor:
+                query["cursor"] = cursor
+            response = client.get(url, params=query)
+            assert response.status_code == 200
+            seen.extend(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return seen
+
+    def test_cursor_walks_every_row_once_in_order(self):
+        rows = self._walk("/api/sweets")
+        assert [s["id"] for s in rows] == sorted(s["id"] for s in rows)
+        assert len(rows) == 5
+
+    def test_cursor_with_sort_key_is_stable_on_ties(self):
+        rows = self._walk("/api/sweets", sort="price")
+        assert [(s["price"], s["id"]) for s in rows] == sorted((s["price"], s["id"]) for s in rows)
+        assert len({s["id"] for s in rows}) == 5
+
+    def test_cursor_pagination_for_search(self):
+        rows = self._walk("/api/sweets/search", min_price=3.0, sort="name")
+        assert [s["name"] for s in rows] == ["Sweet 0", "Sweet 1", "Sweet 2", "Sweet 4"]
+
+    def test_page_is_unaffected_by_edits_before_cursor(self):
+        first = client.get("/api/sweets", params={"limit": 2})
+        cursor = first.headers["X-Next-Cursor"]
+        token = _get_auth_token("admin_pages", "secret123")
+        client.delete(f"/api/sweets/{first.json()[0]['id']}", headers={"Authorization": f"Bearer {token}"})
+
+        second = client.get("/api/sweets", params={"limit": 2, "cursor": cursor})
+        assert second.json()[0]["id"] == first.json()[1]["id"] + 1
+
+    def test_skip_limit_still_supported(self):
+        response = client.get("/api/sweets", params={"skip": 4, "limit": 2})
+        assert len(response.json()) == 1
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_invalid_cursor_rejected(self):
+        assert client.get("/api/sweets", params={"cursor": "garbage"}).status_code == 400
+        cursor = client.get("/api/sweets", params={"limit": 2}).headers["X-Next-Cursor"]
+        response = client.get("/api/sweets", params={"cursor": cursor, "sort": "price"})
+        assert response.status_code == 400
+
+
+class TestFullTextSearch:
+    """Indexed name search for GET /api/sweets/search, on every search backend."""
+
+    @pytest.fixture(autouse=True, params=["auto", "memory"])
+    def setup(self, request, monkeypatch):
+        from app.config import settings
+        monkeypatch.setattr(settings, "search_backend", request.param)
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_fts", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        for name in ["Gulab Jamun", "Jamun Jam Roll", "Kaju Katli", "Jalebi"]:
+            client.post(
+                "/api/sweets",
+                json={"name": name, "category": "fts", "price": 2.0, "quantity": 1},
+                headers=self.headers
+            )
+        yield
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+    def test_seeded_sweets_are_searchable(self, monkeypatch):
+        """Sweets inserted by the startup seed are indexed straight away, not on the next restart."""
+        from app import catalog
+        from app.db.session import SessionLocal
+        from app.seed import seed_sweets
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        monkeypatch.delenv("PYTEST_CURRENT_TEST")
+        monkeypatch.setattr(catalog.catalog_cache, "max_rows", 0)
+        db = SessionLocal()
+        try:
+            seed_sweets(db)
+        finally:
+            db.close()
+        assert self._names(name="jalebi") == ["Jalebi"]
+
+    def test_memory_index_applies_only_committed_changes(self, monkeypatch):
+        """A rolled-back create never reaches the index; another worker's write shows up after the TTL."""
+        from sqlalchemy import insert
+        from app import catalog, models, search
+        from app.config import settings
+        from app.db.session import SessionLocal
+        monkeypatch.setattr(settings, "search_backend", "memory")
+        monkeypatch.setattr(catalog.catalog_cache, "max_rows", 0)
+        assert self._names(name="jalebi") == ["Jalebi"]  # loads the index
+
+        with SessionLocal() as db:
+            sweet = models.Sweet(name="Phantom Peda", category="fts", price=1.0, quantity=1)
+            db.add(sweet)
+            db.flush()
+            search.index_sweet(db, sweet.id, sweet.name)
+            db.rollback()
+        with SessionLocal() as db:
+            # Committed without touching this process's index, as another worker would.
+            db.execute(insert(models.Sweet).values(name="Rasmalai", category="fts", price=1.0, quantity=1))
+            db.commit()
+        assert self._names(name="phantom") == []
+        assert self._names(name="rasmalai") == []
+
+        monkeypatch.setattr(settings, "search_index_ttl", 0)
+        assert self._names(name="rasmalai") == ["Rasmalai"]
+        assert self._names(name="phantom") == []
+
+    def _names(self, **params):
+        response = client.get("/api/sweets/search", params=params)
+        assert response.status_code == 200
+        return [s["name"] for s in response.json()]
+
+    def test_prefix_matching_on_every_word(self):
+        assert sorted(self._names(name="ja")) == ["Gulab Jamun", "Jalebi", "Jamun Jam Roll"]
+        assert self._names(name="gul jam") == ["Gulab Jamun"]
+        assert self._names(name="KATLI") == ["Kaju Katli"]
+
+    def test_results_ranked_by_relevance(self):
+        names = self._names(name="jam")
+        assert names[0] == "Jamun Jam Roll"
+        assert set(names) == {"Jamun Jam Roll", "Gulab Jamun"}
+
+    def test_explicit_sort_overrides_relevance(self):
+        assert self._names(name="jam", sort="name") == ["Gulab Jamun", "Jamun Jam Roll"]
+
+    def test_index_follows_create_and_delete(self):
+        sweets = client.get("/api/sweets/search", params={"name": "kaju"}).json()
+        client.delete(f"/api/sweets/{sweets[0]['id']}", headers=self.headers)
+        assert self._names(name="kaju") == []
+
+        client.post(
+            "/api/sweets",
+            json={"name": "Kaju Roll", "category": "fts", "price": 2.0, "quantity": 1},
+            headers=self.headers
+        )
+        assert self._names(name="kaju") == ["Kaju Roll"]
+
+    def test_relevance_cursor_pagination(self):
+        first = client.get("/api/sweets/search", params={"name": "ja", "limit": 2})
+        second = client.get(
+            "/api/sweets/search",
+            params={"name": "ja", "limit": 2, "cursor": first.headers["X-Next-Cursor"]}
+        )
+        names = [s["name"] for s in first.json() + second.json()]
+        assert sorted(names) == ["Gulab Jamun", "Jalebi", "Jamun Jam Roll"]
+
+
+class TestCatalogCache:
+    """GET /api/sweets and /api/sweets/search are served from the versioned catalog cache."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_cache", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.sweet = client.post(
+            "/api/sweets",
+            json={"name": "Cached Peda", "category": "milk", "price": 3.0, "quantity": 5},
+            headers=self.headers
+        ).json()
+        yield
+
+    def test_repeat_reads_hit_cache(self):
+        from app.catalog import catalog_cache
+        client.get("/api/sweets")
+        before = catalog_cache.stats()
+        client.get("/api/sweets")
+        client.get("/api/sweets/search", params={"name": "peda"})
+        after = catalog_cache.stats()
+        assert after["hits"] - before["hits"] == 2
+        assert after["misses"] == before["misses"]
+
+    def test_paging_edges_match_database(self, monkeypatch):
+        """Cache and database page identically; out-of-range skip/limit are rejected."""
+        from app.catalog import catalog_cache
+        client.post(
+            "/api/sweets",
+            json={"name": "Cached Barfi", "category": "milk", "price": 2.0, "quantity": 5},
+            headers=self.headers
+        )
+        cases = [
+            ("/api/sweets", {"limit": 1}),
+            ("/api/sweets", {"skip": 1, "limit": 1000}),
+            ("/api/sweets", {"skip": 5}),
+            ("/api/sweets/search", {"category": "milk", "limit": 1, "sort": "price"}),
+        ]
+        cached = [client.get(path, params=params).json() for path, params in cases]
+        monkeypatch.setattr(catalog_cache, "max_rows", 0)
+        assert [client.get(path, params=params).json() for path, params in cases] == cached
+        assert [len(page) for page in cached] == [1, 1, 0, 1]
+
+        for params in ({"limit": -1}, {"limit": 0}, {"limit": 1001}, {"skip": -1}):
+            assert client.get("/api/sweets", params=params).status_code == 422
+            assert client.get("/api/sweets/search", params=params).status_code == 422
+
+    def test_writes_bump_version_and_are_visible(self):
+        from app.catalog import catalog_cache
+        client.get("/api/sweets")
+        version = catalog_cache.stats()["version"]
+
+        client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers)
+        client.put(f"/api/sweets/{self.sweet['id']}", json={"price": 9.0}, headers=self.headers)
+        assert catalog_cache.stats()["version"] > version
+
+        listed = client.get("/api/sweets").json()
+        assert [(s["quantity"], s["price"]) for s in listed] == [(4, 9.0)]
+        assert client.get("/api/sweets/search", params={"max_price": 5.0}).json() == []
+
+    def test_create_and_delete_are_visible(self):
+        client.get("/api/sweets")
+        created = client.post(
+            "/api/sweets",
+            json={"name": "Fresh Barfi", "category": "milk", "price": 2.0, "quantity": 1},
+            headers=self.headers
+        ).json()
+        assert {s["id"] for s in client.get("/api/sweets").json()} == {self.sweet["id"], created["id"]}
+
+        client.delete(f"/api/sweets/{self.sweet['id']}", headers=self.headers)
+        assert [s["name"] for s in client.get("/api/sweets/search", params={"category": "milk"}).json()] == ["Fresh Barfi"]
+
+    def test_failed_purchase_does_not_invalidate(self):
+        from app.catalog import catalog_cache
+        empty = client.post(
+            "/api/sweets",
+            json={"name": "Empty", "category": "milk", "price": 2.0, "quantity": 0},
+            headers=self.headers
+        ).json()
+        client.get("/api/sweets")
+        version = catalog_cache.stats()["version"]
+        assert client.post(f"/api/sweets/{empty['id']}/purchase", headers=self.headers).status_code == 400
+        assert catalog_cache.stats()["version"] == version
+
+    def test_oversized_catalog_falls_back_to_database(self, monkeypatch):
+        from app.catalog import catalog_cache
+        monkeypatch.setattr(catalog_cache, "max_rows", 0)
+        assert [s["name"] for s in client.get("/api/sweets").json()] == ["Cached Peda"]
+
+
+class TestConditionalRequests:
+    """Catalog list endpoints carry strong ETags and answer If-None-Match with 304."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_etag", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.sweet = client.post(
+            "/api/sweets",
+            json={"name": "Tagged Ladoo", "category": "festive", "price": 2.5, "quantity": 3},
+            headers=self.headers
+        ).json()
+        yield
+
+    def test_matching_etag_returns_304_without_reading(self):
+        from app.catalog import catalog_cache
+        first = client.get("/api/sweets")
+        etag = first.headers["ETag"]
+        assert etag.startswith('"')
+
+        before = catalog_cache.stats()
+        response = client.get("/api/sweets", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+        after = catalog_cache.stats()
+        assert (after["hits"], after["misses"]) == (before["hits"], before["misses"])
+
+    def test_weak_and_listed_etags_match(self):
+        etag = client.get("/api/sweets/search", params={"name": "ladoo"}).headers["ETag"]
+        response = client.get(
+            "/api/sweets/search",
+            params={"name": "ladoo"},
+            headers={"If-None-Match": f'"other", W/{etag}'}
+        )
+        assert response.status_code == 304
+
+    def test_writes_change_the_etag(self):
+        etag = client.get("/api/sweets").headers["ETag"]
+        client.post(f"/api/sweets/{self.sweet['id']}/purchase", headers=self.headers)
+        response = client.get("/api/sweets", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()[0]["quantity"] == 2
+
+    def test_products_etag_changes_on_create(self):
+        etag = client.get("/api/products").headers["ETag"]
+        assert client.get("/api/products", headers={"If-None-Match": etag}).status_code == 304
+        client.post("/api/products", json={"name": "Gift Box", "description": "", "price": 10.0}, headers=self.headers)
+        response = client.get("/api/products", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [p["name"] for p in response.json()] == ["Gift Box"]
+
+
+class TestListSerialization:
+    """List endpoints encode plain rows directly instead of validating them through Pydantic."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_fastjson", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        for i in range(3):
+            client.post(
+                "/api/sweets",
+                json={"name": f"Kaju Katli {i}", "category": "dry fruit", "price": 4.5 + i, "quantity": i},
+                headers=self.headers
+            )
+        yield
+
+    def test_body_matches_response_model(self):
+        from app import schemas
+        for path, params in (("/api/sweets", {}), ("/api/sweets/search", {"name": "kaju"})):
+            response = client.get(path, params=params)
+            assert response.headers["content-type"] == "application/json"
+            for sweet in response.json():
+                assert schemas.SweetResponse.model_validate(sweet).model_dump() == sweet
+
+    def test_headers_are_kept(self):
+        response = client.get("/api/sweets", params={"limit": 2})
+        assert "ETag" in response.headers
+        assert "X-Next-Cursor" in response.headers
+
+    def test_products_are_plain_rows(self):
+        client.post("/api/products", json={"name": "Hamper", "description": None, "price": 12.0}, headers=self.headers)
+        assert client.get("/api/products").json() == [
+            {"name": "Hamper", "description": None, "price": 12.0, "id": 1}
+        ]
+
+
+class TestCatalogExport:
+    """GET /api/sweets/export streams the whole catalog for admins."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_export", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        for i in range(5):
+            client.post(
+                "/api/sweets",
+                json={"name": f"Export, \"Sweet\" {i}", "category": "misc", "price": 1.5 + i, "quantity": i},
+                headers=self.headers
+            )
+        yield
+
+    def test_ndjson_export(self):
+        import json
+        response = client.get("/api/sweets/export", headers=self.headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["id"] for row in rows] == [1, 2, 3, 4, 5]
+        assert rows[0] == {"id": 1, "name": 'Export, "Sweet" 0', "category": "misc", "price": 1.5, "quantity": 0}
+
+    def test_csv_export(self):
+        import csv
+        import io
+        response = client.get("/api/sweets/export", params={"format": "csv"}, headers=self.headers)
+        assert response.status_code == 200
+        assert 'filename="sweets.csv"' in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 5
+        assert rows[4] == {"id": "5", "name": 'Export, "Sweet" 4', "category": "misc", "price": "5.5", "quantity": "4"}
+
+    def test_export_streams_in_batches(self):
+        from app import export
+        chunks = list(export.ndjson_lines(batch_size=2))
+        assert [chunk.count(b"\n") for chunk in chunks] == [2, 2, 1]
+
+    def test_export_requires_admin(self):
+        token = _get_auth_token("exportuser", "secret123")
+        response = client.get("/api/sweets/export", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 403
+        assert client.get("/api/sweets/export", params={"format": "xml"}, headers=self.headers).status_code == 422
+
+
+class TestBulkImport:
+    """POST /api/sweets/import inserts or updates sweets by name in chunks and reports bad rows."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_import", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.existing = client.post(
+            "/api/sweets",
+            json={"name": "Rasgulla", "category": "milk", "price": 2.0, "quantity": 1},
+            headers=self.headers
+        ).json()
+        yield
+
+    def _upload(self, filename: str, content: str, **params):
+        return client.post(
+            "/api/sweets/import",
+            params=params,
+            files={"file": (filename, content.encode())},
+            headers=self.headers
+        )
+
+    def test_csv_import_inserts_updates_and_reports(self):
+        client.get("/api/sweets")  # warm the catalog cache
+        content = (
+            "name,category,price,quantity\n"
+            "Rasgulla,bengali,2.5,40\n"
+            "Sandesh,bengali,3.0,10\n"
+            "Broken,bengali,-1,5\n"
+            ",bengali,1.0,x\n"
+        )
+        response = self._upload("supplier.csv", content)
+        assert response.status_code == 200
+        report = response.json()
+        assert (report["inserted"], report["updated"], report["failed"]) == (1, 1, 2)
+        assert [error["row"] for error in report["errors"]] == [3, 4]
+        assert any(message.startswith("price") for message in report["errors"][0]["errors"])
+        assert len(report["errors"][1]["errors"]) == 2
+
+        sweets = {s["name"]: s for s in client.get("/api/sweets").json()}
+        assert sweets["Rasgulla"]["id"] == self.existing["id"]
+        assert (sweets["Rasgulla"]["category"], sweets["Rasgulla"]["price"], sweets["Rasgulla"]["quantity"]) == ("bengali", 2.5, 40)
+        assert [s["name"] for s in client.get("/api/sweets/search", params={"name": "sand"}).json()] == ["Sandesh"]
+
+    def test_ndjson_import_in_chunks(self):
+        import io
+        from app import importer
+        from app.db.session import SessionLocal
+        lines = [f'{{"name": "Bulk {i}", "category": "bulk", "price": 1.0, "quantity": {i}}}' for i in range(25)]
+        lines.insert(5, "{not json")
+        db = SessionLocal()
+        try:
+            records = importer.read_records(io.BytesIO("\n".join(lines).encode()), "ndjson")
+            report = importer.import_sweets(db, records, chunk_size=10)
+        finally:
+            db.close()
+        assert (report["inserted"], report["failed"]) == (25, 1)
+        assert report["errors"][0]["row"] == 6
+        assert len(client.get("/api/sweets/search", params={"category": "bulk"}).json()) == 25
+
+    def test_duplicate_names_update_the_oldest_sweet(self):
+        """Names are not unique; an import matches the lowest id and leaves the others alone."""
+        duplicate = client.post(
+            "/api/sweets",
+            json={"name": "Rasgulla", "category": "milk", "price": 2.0, "quantity": 1},
+            headers=self.headers
+        ).json()
+        response = self._upload("supplier.csv", "name,category,price,quantity\nRasgulla,bengali,2.5,40\n")
+        assert (response.json()["inserted"], response.json()["updated"]) == (0, 1)
+        quantities = {s["id"]: s["quantity"] for s in client.get("/api/sweets").json()}
+        assert quantities == {self.existing["id"]: 40, duplicate["id"]: 1}
+
+    def test_import_replaces_sharded_stock(self):
+        client.put(f"/api/sweets/{self.existing['id']}/stock-buckets", json={"buckets": 4}, headers=self.headers)
+        response = self._upload("restock.ndjson", '{"name": "Rasgulla", "category": "milk", "price": 2.0, "quantity": 9}\n')
+        assert response.json()["updated"] == 1
+        for _ in range(9):
+            assert client.post(f"/api/sweets/{self.existing['id']}/purchase", headers=self.headers).status_code == 200
+        assert client.post(f"/api/sweets/{self.existing['id']}/purchase", headers=self.headers).status_code == 400
+
+    def test_cli(self, tmp_path, capsys):
+        import json
+        from app import importer
+        path = tmp_path / "catalog.csv"
+        path.write_text("name,category,price,quantity\nPeda,milk,1.5,3\n")
+        assert importer.main([str(path)]) == 0
+        assert json.loads(capsys.readouterr().out)["inserted"] == 1
+
+    def test_import_requires_admin(self):
+        token = _get_auth_token("importuser", "secret123")
+        response = client.post(
+            "/api/sweets/import",
+            files={"file": ("x.csv", b"name,category,price,quantity\n")},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 403
+
+
+class TestStockStream:
+    """GET /api/sweets/stream pushes stock changes to subscribers."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        token = _get_auth_token("admin_stream", "secret123")
+        self.headers = {"Authorization": f"Bearer {token}"}
+        yield
+
+    def test_committed_changes_are_pushed(self):
+        import asyncio
+        import json
+        from starlette.concurrency import run_in_threadpool
+        from app import stream
+
+        async def scenario():
+            body = stream.events(stream.stock_feed.subscribe(), heartbeat=5)
+            assert await anext(body) == f"retry: {stream.RETRY_MS}\n\n"
+            created = (await run_in_threadpool(
+                client.post, "/api/sweets",
+                json={"name": "Kaju Katli", "category": "barfi", "price": 4.0, "quantity": 2}, headers=self.headers
+            )).json()
+            first = await asyncio.wait_for(anext(body), 5)
+            await run_in_threadpool(client.post, f"/api/sweets/{created['id']}/purchase", headers=self.headers)
+            second = await asyncio.wait_for(anext(body), 5)
+            await run_in_threadpool(client.delete, f"/api/sweets/{created['id']}", headers=self.headers)
+            third = await asyncio.wait_for(anext(body), 5)
+            await body.aclose()
+            return created["id"], [first, second, third]
+
+        sweet_id, messages = asyncio.run(scenario())
+        assert all(message.startswith("event: stock\ndata: ") for message in messages)
+        assert [json.loads(message.split("data: ", 1)[1]) for message in messages] == [
+            [{"id": sweet_id, "price": 4.0, "quantity": 2}],
+            [{"id": sweet_id, "price": 4.0, "quantity": 1}],
+            [{"id": sweet_id, "deleted": True}],
+        ]
+        assert stream.stock_feed.stats()["subscribers"] == 0
+
+    def test_slow_consumer_is_dropped(self):
+        import asyncio
+        from app import stream
+
+        async def scenario():
+            feed = stream.StockFeed(buffer=2)
+            slow, fast = feed.subscribe(), feed.subscribe()
+            for quantity in range(3):
+                feed.broadcast([{"id": 1, "price": 1.0, "quantity": quantity}])
+                fast.get_nowait()
+            return slow, feed
+
+        slow, feed = asyncio.run(scenario())
+        assert feed.stats() == {"subscribers": 1, "dropped": 1}
+        assert slow.qsize() == 1 and slow.get_nowait() is stream._CLOSED
+
+    def test_publisher_does_not_inherit_request_context(self):
+        """Queries the publisher runs are not charged to the request that started it."""
+        import asyncio
+        from starlette.concurrency import run_in_threadpool
+        from app import profiling, stream
+
+        async def scenario():
+            with profiling.track_queries() as stats:
+                body = stream.events(stream.stock_feed.subscribe(), heartbeat=5)
+                await anext(body)
+            await run_in_threadpool(
+                client.post, "/api/sweets",
+                json={"name": "Sandesh", "category": "milk", "price": 3.0, "quantity": 4}, headers=self.headers
+            )
+            await asyncio.wait_for(anext(body), 5)
+            await body.aclose()
+            return stats.count
+
+        assert asyncio.run(scenario()) == 0
@@ -0,0 +1,287 @@
+"""
+Drive mixed shop traffic at the API and report per-endpoint throughput and
+latency percentiles, optionally failing on regressions against a baseline.
+
+Traffic is a weighted mix of browse (GET /api/sweets, alternating sort keys
+and pages), search, purchase, restock and login, issued by --concurrency
+workers for --duration seconds. By default the app is served in-process
+through httpx's ASGI transport on a fresh SQLite database (client and server
+then share one event loop, so absolute numbers are conservative); pass --url
+to load a running server instead, e.g. one started with uvicorn. It needs
+permission to create users and sweets there.
+
+Run from backend/:
+
+    python -m benchmarks.loadtest --duration 10 --concurrency 20
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --mix browse=70,purchase=30
+    python -m benchmarks.loadtest --save-baseline baseline.json
+    python -m benchmarks.loadtest --baseline baseline.json --tolerance 0.25
+
+With --baseline the run fails (exit status 1) when an endpoint's p50 or p99
+is more than --tolerance above the stored value, its throughput is more than
+--tolerance below it, or any request failed. Expected business outcomes,
+such as 400 Out of stock on a purchase, do not count as failures.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import httpx
+
+DEFAULT_MIX = "browse=50,search=20,purchase=20,restock=5,login=5"
+PASSWORD = "loadtest-secret"
+# Statuses that are a correct answer for the operation, not a failure.
+EXPECTED = {
+    "browse": {200},
+    "search": {200},
+    "purchase": {200, 400},
+    "restock": {200},
+    "login": {200},
+}
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in EXPECTED:
+            raise SystemExit(f"unknown operation {name!r}; choose from {', '.join(EXPECTED)}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class Shop:
+    """Fixture data and one coroutine per traffic kind."""
+
+    def __init__(self, client: httpx.AsyncClient, sweets: int, users: int):
+        self.client = client
+        self.sweet_count = sweets
+        self.user_count = users
+        self.sweet_ids: list[int] = []
+        self.usernames: list[str] = []
+        self.search_terms: list[str] = []
+        self.admin_headers: dict = {}
+        self.user_headers: list[dict] = []
+
+    async def _login(self, username: str) -> httpx.Response:
+        return await self.client.post("/api/auth/login", data={"username": username, "password": PASSWORD})
+
+    async def _user(self, username: str) -> dict:
+        await self.client.post(
+            "/api/auth/register",
+            json={"username": username, "password": PASSWORD, "full_name": "Load Test"},
+        )
+        response = await self._login(username)
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def setup(self):
+        run = f"{int(time.time())}{random.randrange(1000):03d}"
+        self.admin_headers = await self._user(f"loadtest_admin_{run}")
+        self.usernames = [f"loadtest_user_{run}_{i}" for i in range(self.user_count)]
+        self.user_headers = [await self._user(username) for username in self.usernames]
+
+        catalog = "name,category,price,quantity\n" + "".join(
+            f"Sweet {run}-{i},category {i % 10},{1.0 + i % 50},1000000\n" for i in range(self.sweet_count)
+        )
+        response = await self.client.post(
+            "/api/sweets/import",
+            files={"file": ("loadtest.csv", catalog.encode(), "text/csv")},
+            headers=self.admin_headers,
+        )
+        response.raise_for_status()
+        exported = await self.client.get("/api/sweets/export", headers=self.admin_headers)
+        exported.raise_for_status()
+        names = {}
+        for line in exported.text.splitlines():
+            sweet = json.loads(line)
+            if sweet["name"].startswith(f"Sweet {run}-"):
+                names[sweet["id"]] = sweet["name"]
+        if not names:
+            raise SystemExit("the imported sweets are not in the catalog")
+        self.sweet_ids = list(names)
+        self.search_terms = ["Sweet"] + random.sample(list(names.values()), min(20, len(names)))
+
+    async def browse(self):
+        sort = random.choice(("id", "price", "name"))
+        return await self.client.get("/api/sweets", params={"sort": sort, "limit": 50, "skip": random.randrange(0, 200, 50)})
+
+    async def search(self):
+        return await self.client.get("/api/sweets/search", params={"name": random.choice(self.search_terms), "limit": 20})
+
+    async def purchase(self):
+        sweet_id = random.choice(self.sweet_ids)
+        return await self.client.post(f"/api/sweets/{sweet_id}/purchase", headers=random.choice(self.user_headers))
+
+    async def restock(self):
+        sweet_id = random.choice(self.sweet_ids)
+        return await self.client.post(
+            f"/api/sweets/{sweet_id}/restock", json={"quantity": 10}, headers=self.admin_headers
+        )
+
+    async def login(self):
+        return await self._login(random.choice(self.usernames))
+
+
+async def worker(shop: Shop, operations: list[str], weights: list[int], deadline: float, samples: dict, failures: dict):
+    while time.perf_counter() < deadline:
+        name = random.choices(operations, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await getattr(shop, name)()
+            ok = response.status_code in EXPECTED[name]
+        except httpx.HTTPError:
+            ok = False
+        samples[name].append(time.perf_counter() - start)
+        if not ok:
+            failures[name] += 1
+
+
+def summarize(samples: dict, failures: dict, elapsed: float) -> dict:
+    endpoints = {}
+    for name, timings in samples.items():
+        if not timings:
+            continue
+        timings.sort()
+        endpoints[name] = {
+            "requests": len(timings),
+            "failures": failures[name],
+            "rps": round(len(timings) / elapsed, 1),
+            "p50_ms": round(percentile(timings, 0.50) * 1000, 2),
+            "p90_ms": round(percentile(timings, 0.90) * 1000, 2),
+            "p99_ms": round(percentile(timings, 0.99) * 1000, 2),
+            "max_ms": round(timings[-1] * 1000, 2),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 1), "endpoints": endpoints}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of results against baseline, as human-readable lines (empty when within tolerance)."""
+    problems = []
+    for name, current in results["endpoints"].items():
+        if current["failures"]:
+            problems.append(f"{name}: {current['failures']} failed requests")
+        expected = baseline.get("endpoints", {}).get(name)
+        if expected is None:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if current[key] > expected[key] * (1 + tolerance):
+                problems.append(f"{name}: {key} {current[key]} > baseline {expected[key]} (+{tolerance:.0%})")
+        if current["rps"] < expected["rps"] * (1 - tolerance):
+            problems.append(f"{name}: rps {current['rps']} < baseline {expected['rps']} (-{tolerance:.0%})")
+    return problems
+
+
+def print_report(results: dict):
+    print(f"{results['requests']} requests in {results['elapsed_s']} s ({results['rps']} req/s)")
+    print(f"  {'endpoint':<10} {'requests':>8} {'fail':>5} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, row in sorted(results["endpoints"].items()):
+        print(
+            f"  {name:<10} {row['requests']:>8} {row['failures']:>5} {row['rps']:>8} "
+            f"{row['p50_ms']:>8} {row['p90_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8}"
+        )
+
+
+async def run(args, client: httpx.AsyncClient) -> dict:
+    weights = parse_mix(args.mix)
+    shop = Shop(client, sweets=args.sweets, users=args.users)
+    await shop.setup()
+
+    operations = list(weights)
+    samples = {name: [] for name in operations}
+    failures = {name: 0 for name in operations}
+    if args.warmup > 0:
+        warmup_deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(
+            worker(shop, operations, list(weights.values()), warmup_deadline, {n: [] for n in operations}, dict(failures))
+            for _ in range(args.concurrency)
+        ))
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        worker(shop, operations, list(weights.values()), start + args.duration, samples, failures)
+        for _ in range(args.concurrency)
+    ))
+    return summarize(samples, failures, time.perf_counter() - start)
+
+
+async def run_in_process(args) -> dict:
+    # Point the app at a scratch database before it is imported.
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'loadtest.db')}"
+        from app.main import app
+        from app.db.session import engine
+        from app import hashing
+
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+                return await run(args, client)
+        finally:
+            hashing.shutdown()
+            engine.dispose()
+
+
+async def run_against(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        return await run(args, client)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of measured traffic")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of unmeasured traffic first")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. browse=50,purchase=20")
+    parser.add_argument("--sweets", type=int, default=500, help="sweets to import before the run")
+    parser.add_argument("--users", type=int, default=5, help="shoppers to register before the run")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as a baseline for later runs")
+    parser.add_argument("--baseline", help="fail when results regress past this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed drift from the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    results = asyncio.run(run_against(args) if args.url else run_in_process(args))
+    results["target"] = args.url or "in-process"
+    results["concurrency"] = args.concurrency
+    print_report(results)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as out:
+                json.dump(results, out, indent=2)
+                out.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as stored:
+            problems = compare(results, json.load(stored), args.tolerance)
+        if problems:
+            print("Regressions against", args.baseline)
+            for problem in problems:
+                print("  " + problem)
+            return 1
+        print(f"Within {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Compare the two ways a list endpoint can turn sweets into JSON:
+
+- orm:  load Sweet ORM objects, validate them into SweetResponse, dump JSON
+        (what response_model=list[SweetResponse] does with ORM results)
+- rows: select plain columns and encode them with app.responses.encode_rows
+
+Run from backend/:  python -m benchmarks.serialization [--rows 10000] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from app import crud, models, responses, schemas
+from app.db.session import Base
+
+
+def orm_path(db):
+    adapter = TypeAdapter(list[schemas.SweetResponse])
+    sweets = db.query(models.Sweet).all()
+    return adapter.dump_json(adapter.validate_python(sweets, from_attributes=True))
+
+
+def rows_path(db):
+    rows = db.execute(select(*crud.SWEET_COLUMNS).order_by(models.Sweet.id)).all()
+    return responses.encode_rows(rows, schemas.SweetResponse)
+
+
+def measure(session_factory, fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        with session_factory() as db:
+            start = time.perf_counter()
+            fn(db)
+            timings.append(time.perf_counter() - start)
+    with session_factory() as db:
+        tracemalloc.start()
+        body = fn(db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return statistics.median(timings), peak, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(insert(models.Sweet), [
+                {"name": f"Sweet {i}", "category": f"category {i % 10}", "price": 1.0 + i % 50, "quantity": i % 100}
+                for i in range(args.rows)
+            ])
+        session_factory = sessionmaker(bind=engine)
+
+        print(f"{args.rows} rows, median of {args.repeat} runs, json encoder: {'orjson' if responses.orjson else 'json'}")
+        results = {}
+        for name, fn in (("orm", orm_path), ("rows", rows_path)):
+            results[name] = measure(session_factory, fn, args.repeat)
+            seconds, peak, size = results[name]
+            print(f"  {name:<5} {seconds * 1000:8.1f} ms  peak {peak / 1024 / 1024:6.1f} MiB  body {size / 1024:7.1f} KiB")
+        print(f"  speedup {results['orm'][0] / results['rows'][0]:.1f}x, "
+              f"peak memory {results['rows'][1] / results['orm'][1]:.0%} of orm")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()